@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+
+
+import numpy as np
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"  # As given by the API
+CONTRIBUTIONS_COLUMNS = ["revid", "parentid", "timestamp", "user", "size", "content"]
+
+
+def parse_timestamp(timestamp):
+    """
+    API timestamp to seconds since the epoch.
+    """
+    return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp())
+
+
+def format_timestamp(seconds):
+    """
+    Seconds since the epoch to an API timestamp.
+    """
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def contributions_from_items(items):
+    """
+    Columnar form of a list of contributions, as `{"users": [...], "revid": [...], "parentid": [...], ...}`.
+
+    Each contribution is a row across the columns: ids and sizes are ints, timestamps are seconds since the epoch,
+    "user" is an index in "users", so that each username is only kept once, and "content" identifies the content of
+    the revision (see content_id).
+    This stays JSON serializable, and is several times smaller than a dict per contribution.
+
+    The derived columns of derive_contributions are added as well.
+    """
+    users = {}
+    contributions = {"users": [], **{column: [] for column in CONTRIBUTIONS_COLUMNS}}
+
+    for item in items:
+        if item["username"] not in users:
+            users[item["username"]] = len(users)
+            contributions["users"].append(item["username"])
+
+        contributions["revid"].append(item["revid"])
+        contributions["parentid"].append(item["parentid"])
+        contributions["timestamp"].append(parse_timestamp(item["timestamp"]))
+        contributions["user"].append(users[item["username"]])
+        contributions["size"].append(item["size"])
+        contributions["content"].append(item.get("content", 0))
+
+    derive_contributions(contributions)
+
+    return contributions
+
+
+def contributions_to_items(contributions):
+    """
+    Back from the columnar form to a list of `{"revid", "parentid", "timestamp", "username", "size", "content"}` dicts.
+    """
+    if "items" in contributions:  # Results from before the columnar form
+        return [dict(item) for item in contributions["items"]]
+
+    users = contributions["users"]
+    return [
+        {
+            "revid": revid,
+            "parentid": parentid,
+            "timestamp": format_timestamp(timestamp),
+            "username": users[user],
+            "size": size,
+            "content": content,
+        }
+        for revid, parentid, timestamp, user, size, content in zip(
+            *(contributions.get(column, [0] * len(contributions["revid"])) for column in CONTRIBUTIONS_COLUMNS)
+        )
+    ]
+
+
+def content_id(sha1):
+    """
+    Int identifying the content of a revision, from its SHA-1 (63 bits of it, to fit in an int64). 0 if unknown.
+    """
+    return int(sha1, 16) & (2**63 - 1) if sha1 else 0
+
+
+def derive_contributions(contributions):
+    """
+    Add the columns derived from the others, computed once for all the revisions (newest first, as the API gives them):
+    - "delta": size change, from the parent revision when known, else from the previous one in the list
+    - "revert": 1 if the revision restores the content of an older one (not just its parent), else 0
+    """
+    size = np.asarray(contributions["size"], dtype=np.int64)
+    revid = np.asarray(contributions["revid"], dtype=np.int64)
+    parentid = np.asarray(contributions["parentid"], dtype=np.int64)
+    content = np.asarray(contributions["content"], dtype=np.int64)
+    count = len(revid)
+
+    # Size of the parent: found among the revisions, or the next (older) one, or 0 for the creation of the page
+    order = np.argsort(revid)
+    position = np.minimum(np.searchsorted(revid, parentid, sorter=order), max(count - 1, 0))
+    found = revid[order][position] == parentid
+    parent_size = np.where(found, size[order][position], np.append(size[1:], 0))
+    unknown = ~found & (np.arange(count) == count - 1) & (parentid != 0)  # Oldest revision, parent out of the window
+    contributions["delta"] = np.where(unknown, 0, size - parent_size).tolist()
+
+    # Oldest first, a revert has the content of a revision before its parent
+    oldest_first = content[::-1]
+    _, first, inverse = np.unique(oldest_first, return_index=True, return_inverse=True)
+    before = first[inverse] < np.arange(count)
+    not_parent = oldest_first != np.append(-1, oldest_first[:-1])
+    contributions["revert"] = (before & not_parent & (oldest_first != 0))[::-1].astype(np.int64).tolist()
+
+
+def add_periods(timestamp, count, granularity):
+    """
+    Move a pageviews timestamp `count` periods ("daily" or "monthly") forward.
+    """
+    if granularity == "monthly":
+        months = timestamp.year * 12 + timestamp.month - 1 + count
+        return timestamp.replace(year=months // 12, month=months % 12 + 1, day=1)
+    return timestamp + timedelta(days=count)
+
+
+def period_index(start, timestamp, granularity):
+    """
+    Number of periods from `start` to `timestamp`.
+    """
+    if granularity == "monthly":
+        return (timestamp.year - start.year) * 12 + timestamp.month - start.month
+    return (timestamp.date() - start.date()).days
+
+
+def pageviews_from_items(items, granularity):
+    """
+    Series form of a list of `{"timestamp", "views"}` pageviews, sorted by timestamp, as `{"start", "views"}`.
+
+    "views" has one int per period from "start", periods without data count as 0 views.
+    """
+    if not items:
+        return {"start": None, "views": []}
+
+    timestamps = [datetime.fromisoformat(item["timestamp"]) for item in items]
+    views = np.zeros(period_index(timestamps[0], timestamps[-1], granularity) + 1, dtype=np.int64)
+    views[[period_index(timestamps[0], timestamp, granularity) for timestamp in timestamps]] = [
+        item["views"] for item in items
+    ]
+
+    return {"start": timestamps[0].isoformat(), "views": views.tolist()}
+
+
+def pageviews_timestamps(pageviews):
+    """
+    Timestamp of each period of a pageviews series.
+    """
+    if not pageviews["views"]:
+        return []
+
+    start = datetime.fromisoformat(pageviews["start"])
+    return [add_periods(start, i, pageviews["granularity"]) for i in range(len(pageviews["views"]))]
+
+
+def pageviews_to_items(pageviews):
+    """
+    Back from the series form to a list of `{"timestamp", "views"}` dicts.
+    """
+    if "items" in pageviews:  # Results from before the series form
+        return [dict(item) for item in pageviews["items"]]
+
+    return [
+        {"timestamp": timestamp.isoformat(), "views": views}
+        for timestamp, views in zip(pageviews_timestamps(pageviews), pageviews["views"])
+    ]
+
+
+def pageviews_total(pageviews):
+    return int(np.sum(pageviews["views"], dtype=np.int64))
@@ -0,0 +1,53 @@
+def _find(parents, key):
+    while parents[key] != key:
+        parents[key] = parents[parents[key]]  # Path halving, so that lookups stay near constant
+        key = parents[key]
+    return key
+
+
+def article_keys(article):
+    """
+    Keys identifying an article: `(lang, pid)` of the queried page, `(lang, name)` of each of its pages, and its
+    Wikidata item if known. Articles sharing any key are the same article.
+    """
+    query = article["query"]
+    keys = [("pid", query["lang"], query["pid"])]
+    keys += [("name", lang, page["name"]) for lang, page in article["langs"].items()]
+    if "wikidata" in query:
+        keys.append(("item", query["wikidata"]))
+    return keys
+
+
+def merge_articles(candidates):
+    """
+    Merge equivalent articles, with a union-find over their keys (see article_keys), in near linear time.
+
+    `candidates` is a list of `(source, article)` in the order of the inputs, where `source` identifies the input.
+    Returns `[(article, [source, ...])]`, one per set of equivalent articles, in the order of their first input. The
+    article is the first of its set, completed with the langs it lacks from the others.
+    """
+    parents = {}
+    for _, article in candidates:
+        keys = article_keys(article)
+        for key in keys:
+            parents.setdefault(key, key)
+
+        root = _find(parents, keys[0])
+        for key in keys[1:]:
+            other = _find(parents, key)
+            if other != root:
+                parents[other] = root
+
+    groups = {}
+    for source, article in candidates:
+        groups.setdefault(_find(parents, article_keys(article)[0]), []).append((source, article))
+
+    merged = []
+    for members in groups.values():
+        article = members[0][1]
+        for _, other in members[1:]:
+            for lang, page in other["langs"].items():
+                article["langs"].setdefault(lang, page)
+        merged.append((article, [source for source, _ in members]))
+
+    return merged
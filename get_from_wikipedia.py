@@ -1,16 +1,41 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pprint import pprint
 from urllib.parse import quote, unquote, urlparse
+import asyncio
 import datetime
 import json
+import math
+import multiprocessing
+import os
+import queue
+import threading
 
 
-from textstat import textstat
 import requests
 
 
+from columnar import (
+    add_periods,
+    content_id,
+    contributions_from_items,
+    contributions_to_items,
+    pageviews_from_items,
+    pageviews_to_items,
+    pageviews_total,
+    TIMESTAMP_FORMAT,
+)
+from dedup import merge_articles
+from http_cache import CachingAdapter, ResponseCache
+from rate_limit import RequestScheduler
+from readability import preload, text_stats
+from result_file import write_result
+
+
 # URLs
 URL_INFOS = "https://{lang}.wikipedia.org/w/api.php"
 URL_STATS = "https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/{lang}.wikipedia/{access}/{agent}/{uri_article_name}/{granularity}/{start}/{end}"
+URL_SUMMARY = "https://{lang}.wikipedia.org/api/rest_v1/page/summary/{uri_article_name}?redirect=true"
+URL_WIKIDATA = "https://www.wikidata.org/w/api.php"
 
 # Parameters
 HEADERS = {
@@ -22,34 +47,310 @@ HEADERS = {
 PARAMS = {
     "action": "query",
     "format": "json",
+    "maxlag": 5,  # Back off when the database replicas lag, https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
 }
 
 WIKI_LIMIT = 500  # From the API
 GLOBAL_LIMIT = WIKI_LIMIT
 
 BACKLINKS_LIMIT = GLOBAL_LIMIT
+BACKLINKS_COUNT_ONLY = False  # Only count the backlinks, without keeping their titles
+BACKLINKS_COUNT_LIMIT = 100 * WIKI_LIMIT  # Backlinks counted per page in count-only mode
 CONTRIBS_LIMIT = GLOBAL_LIMIT
+CONTRIBUTORS_PER_PAGE = 100  # Assumed on average for each page, when planning how to find the target contributors
 DEFAULT_DURATION = int(2 * 365.25)
 ACCESS = "all-access"
 AGENTS = "all-agents"
 GRANULARITY = "daily"
 
+# Cache of the responses, set CACHE_PATH to None to disable it
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "responses.sqlite")
+CACHE_TTLS = {  # In seconds, per kind of endpoint
+    "action": 24 * 60 * 60,
+    "summary": 7 * 24 * 60 * 60,
+    "pageviews": 30 * 24 * 60 * 60,  # Past days do not change
+}
+CACHE_MAX_SIZE = 512 * 1024 * 1024  # In bytes
+
+TITLES_LIMIT = 50  # From the API, for titles or page ids per request
+USERS_LIMIT = 50  # From the API, for users per request
+BATCH_LINGER = 1  # Seconds to wait for more pages before sending an incomplete batch
+HOST_CONCURRENCY = 8  # Maximum requests in flight at the same time, per host
+RATE_LIMIT = 20  # Requests per second, per host
+RATE_BURST = 10
+MAX_RETRIES = 5
+
 VERBOSE = False
 
+STATS_WORKERS = os.cpu_count() or 1  # Processes computing the text stats, 0 to compute them in the fetching threads
+
+RESOLVE_WITH_WIKIDATA = True  # Find the other langs of the articles with Wikidata sitelinks, rather than langlinks
+NON_WIKIPEDIA_SITES = {"commons", "species", "meta", "wikidata", "mediawiki", "sources", "outreach", "wikimania"}
+
 DEFAULT_LANGS = ["en", "fr", "de"]
 TARGET_DURATION = DEFAULT_DURATION
 
 
-def get_session():
+def get_session(cache=None):
     # Starts request session, that will be used through the whole process
     s = requests.Session()
     s.headers.update(HEADERS)
     s.params.update(PARAMS)
 
+    if cache is not None:
+        adapter = CachingAdapter(cache, pool_maxsize=4 * HOST_CONCURRENCY)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+
     return s
 
 
-s = get_session()
+cache = ResponseCache(CACHE_PATH, CACHE_TTLS, CACHE_MAX_SIZE) if CACHE_PATH else None
+s = get_session(cache)
+scheduler = RequestScheduler(s, RATE_LIMIT, RATE_BURST, HOST_CONCURRENCY, MAX_RETRIES)
+
+_stats_pool = None
+_stats_pool_lock = threading.Lock()
+_host_executors = {}
+_host_executors_lock = threading.Lock()
+
+
+def host_of(url, lang):
+    """
+    Host queried by one of the URL templates, for a given lang.
+    """
+    return urlparse(url.replace("{lang}", lang)).netloc
+
+
+def get_json(url, params=None):
+    """
+    Query an URL through the shared session and its scheduler, and decode the JSON answer.
+
+    Returns `{}` if there is no proper answer, even after retrying, so that only the pages of the request get an error.
+    """
+    try:
+        response = scheduler.get(url, params)
+    except requests.RequestException:  # Retried by the scheduler when worth it
+        return {}
+
+    try:
+        return response.json()
+    except ValueError:  # Not JSON, e.g. an error page after too many retries
+        return {}
+
+
+def host_executor(host):
+    """
+    Threads running the blocking functions of a host, HOST_CONCURRENCY of them, kept for the whole process.
+
+    Each host has its own, so that threads waiting on a host (for its rate limit for instance) never hold back the
+    others, as they would in the small default executor of the event loop.
+    """
+    with _host_executors_lock:
+        if host not in _host_executors:
+            _host_executors[host] = ThreadPoolExecutor(max_workers=HOST_CONCURRENCY, thread_name_prefix=host)
+        return _host_executors[host]
+
+
+def host_runner():
+    """
+    Create a coroutine `run(host, function, *args)`, that runs a blocking function in a thread of its host, with at
+    most HOST_CONCURRENCY functions in flight per host.
+    """
+    semaphores = {}
+
+    async def run(host, function, *args):
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(HOST_CONCURRENCY)
+
+        async with semaphores[host]:
+            return await asyncio.get_running_loop().run_in_executor(host_executor(host), function, *args)
+
+    return run
+
+
+async def arun_tasks(tasks):
+    """
+    Run blocking tasks concurrently, with at most HOST_CONCURRENCY tasks in flight per host.
+
+    Each task is a tuple `(host, function, *args)`, see `host_of`.
+    Results are returned in the same order as the tasks.
+    """
+    run = host_runner()
+    return await asyncio.gather(*(run(*task) for task in tasks))
+
+
+def run_tasks(tasks):
+    """
+    Synchronous wrapper around `arun_tasks`.
+    """
+    return asyncio.run(arun_tasks(list(tasks)))
+
+
+def iter_pages(queries):
+    """
+    Yield `(obj, lang, page)` for each language of each valid query.
+    """
+    for name, obj in queries.items():
+        if "error" in obj:
+            continue
+
+        for lang, page in obj["langs"].items():
+            yield obj, lang, page
+
+
+def index_pages(queries):
+    """
+    Index the pages of the valid queries by `(lang, name)`, to find them back from another result.
+    """
+    if not queries:
+        return {}
+
+    return {(lang, page["name"]): (obj, page) for obj, lang, page in iter_pages(queries)}
+
+
+def find_previous_page(previous, obj, lang, page):
+    """
+    Find a page in an indexed previous result, if it covers at least the same duration.
+    """
+    if (lang, page["name"]) not in previous:
+        return None
+
+    previous_obj, previous_page = previous[(lang, page["name"])]
+    if previous_obj["query"]["duration"] < obj["query"]["duration"]:
+        return None
+
+    return previous_page
+
+
+def batch_pages(queries, size=TITLES_LIMIT):
+    """
+    Group the pages of the valid queries per lang, in batches of at most `size` pages.
+
+    Yields `(lang, [(obj, page), ...])`.
+    """
+    per_lang = {}
+    for obj, lang, page in iter_pages(queries):
+        per_lang.setdefault(lang, []).append((obj, page))
+
+    for lang, pages in per_lang.items():
+        for i in range(0, len(pages), size):
+            yield lang, pages[i : i + size]
+
+
+def continued_by_id(position):
+    """
+    Where a continuation going through the pages by increasing page id is, from its value ("<page id>|...", as for
+    prop=contributors). Returns `(current, key)`, `key(content)` giving the same for each page as answered.
+    """
+    return int(position.split("|")[0]), lambda content: content.get("pageid")
+
+
+def continued_by_title(position):
+    """
+    Same as `continued_by_id`, for the backlinks props (prop=linkshere and the like), going through the pages by
+    namespace and title as stored (with underscores): "<ns>|<title>|<from id>" if the pages are in several namespaces,
+    "<title>|<from id>" if they have several titles, and only "<from id>" for a single page, in which case the current
+    page is unknown (None).
+    """
+
+    def title(content):
+        if "title" not in content:  # Missing page id
+            return None
+        name = content["title"].split(":", 1)[-1] if content.get("ns", 0) != 0 else content["title"]
+        return name.replace(" ", "_")
+
+    def ns_title(content):
+        return None if title(content) is None else (content.get("ns", 0), title(content))
+
+    *fields, _ = position.split("|")
+    if len(fields) == 2:
+        return (int(fields[0]), fields[1]), ns_title
+    elif len(fields) == 1:
+        return fields[0], title
+    return None, title
+
+
+def query_batch(lang, batch, params, merge, error, done=None, follow=True, continued=continued_by_id):
+    """
+    Query the action API for a batch of pages at once, following the continuation.
+
+    Pages are sent by page id when known, else by name. Each page returned by the API is handed back to
+    `merge(obj, page, content)`, once per response it appears in.
+    If `done(page)` is given, pages that are done are not continued any further, and if `follow` is False, the
+    continuation is not followed at all. `continued` tells where the continuation is, see `continued_by_id`.
+    If the API does not answer properly, `obj["error"] = error` is set for the whole batch.
+    """
+    url_full = URL_INFOS.format(lang=lang)
+    pending = sorted(batch, key=lambda item: item[1].get("pid", 0))
+    # Pages as answered, for the continuation
+    answered = {}
+
+    while pending:
+        by_key = {}
+        if all("pid" in page for _, page in pending):
+            for obj, page in pending:
+                by_key.setdefault(str(page["pid"]), []).append((obj, page))
+            batch_params = {"pageids": "|".join(by_key)}
+        else:
+            for obj, page in pending:
+                by_key.setdefault(page["name"], []).append((obj, page))
+            batch_params = {"titles": "|".join(by_key)}
+        batch_params.update(params)
+
+        continuation = {}
+        restart = None
+        while True:
+            data = get_json(url_full, {**batch_params, **continuation})
+
+            if "query" not in data or "pages" not in data["query"]:
+                for obj, _ in pending:
+                    obj["error"] = error
+                return
+
+            normalized = {}
+            for item in data["query"].get("normalized", []):
+                normalized.setdefault(item["to"], []).append(item["from"])
+
+            for pid, content in data["query"]["pages"].items():
+                if "pageids" in batch_params:
+                    keys = [pid]
+                else:
+                    keys = [content["title"]] + normalized.get(content["title"], [])
+
+                for key in keys:
+                    for obj, page in by_key.get(key, []):
+                        answered[id(page)] = {
+                            field: content[field] for field in ("pageid", "ns", "title") if field in content
+                        }
+                        merge(obj, page, content)
+
+            if "continue" not in data or not follow:
+                break
+            continuation = data["continue"]
+
+            if done is not None:
+                if all(done(page) for _, page in pending):
+                    restart = []
+                    break
+
+                # Continuation goes through the pages in order, so if it is stuck on a page that is already done,
+                # start again with the following pages only
+                position = next(value for key, value in continuation.items() if key != "continue")
+                try:
+                    current, key = continued(str(position))
+                except ValueError:  # Unknown format, keep following it
+                    continue
+                keys = {id(page): key(answered[id(page)]) for _, page in pending if id(page) in answered}
+                if current is not None and any(keys.get(id(page)) == current and done(page) for _, page in pending):
+                    restart = [
+                        (obj, page)
+                        for obj, page in pending
+                        if keys.get(id(page)) is not None and keys[id(page)] > current and not done(page)
+                    ]
+                    break
+
+        pending = restart
 
 
 def extract_lang_name(link: str) -> tuple[str, str]:
@@ -78,7 +379,8 @@ def wiki_quote(page_name):
     return quote(page_name.replace(" ", "_"))
 
 
-def links_to_find(target_links, target_langs=None):
+def links_to_find(target_links, target_langs=None, expand=True):
+    # Names without a lang are kept under "*" if `expand` is False, else they are looked for in every target lang
     if target_langs is None:
         target_langs = DEFAULT_LANGS
 
@@ -100,7 +402,7 @@ def links_to_find(target_links, target_langs=None):
             to_find["*"].add(link)
 
     # Each name without a lang will be tracked down using target langs
-    if "*" in to_find:
+    if "*" in to_find and expand:
         for name in to_find["*"]:
             for lang in target_langs:
                 if lang not in to_find:
@@ -115,103 +417,330 @@ def links_to_find(target_links, target_langs=None):
     return to_find
 
 
-def fetch_data(to_find, target_langs=None):
+def _merge_resolved(entry, page, content):
+    if "content" not in entry:
+        entry["content"] = {**content, "langlinks": []}
+
+    entry["content"]["langlinks"] += content.get("langlinks", [])
+
+
+def _description(content):
+    # Short description of a page from the action API, as given by the REST summary: the local one if any, else the one
+    # from Wikidata (prop=description), the pageprops being there in case the description prop is not
+    return content.get("description", content.get("pageprops", {}).get("wikibase-shortdesc"))
+
+
+def _merge_description(entry, page, content):
+    page["description"] = _description(content)
+
+
+def _fetch_description(obj, lang, page):
+    data = get_json(URL_SUMMARY.format(lang=lang, uri_article_name=wiki_quote(page["name"])))
+    if "description" in data:
+        page["description"] = data["description"]
+    else:
+        page["description"] = None
+
+
+def _fetch_descriptions_batch(lang, batch):
+    # https://www.mediawiki.org/wiki/Extension:Wikibase_Client#API
+    # https://www.mediawiki.org/wiki/Extension:ShortDescription
+    # Pages resolved in their own lang already have their description
+    batch = [(obj, page) for obj, page in batch if "description" not in page]
+    if not batch:
+        return
+
+    params = {
+        "prop": "description|pageprops",
+        "ppprop": "wikibase-shortdesc",
+    }
+    # A failed request should not put the whole article in error, so each page gets its own entry
+    query_batch(
+        lang,
+        [({}, page) for _, page in batch],
+        params,
+        _merge_description,
+        "could not retrieve information (description)",
+        follow=False,
+    )
+
+    # The REST summary is only a fallback, for the pages the action API did not answer for
+    for obj, page in batch:
+        if "description" not in page:
+            _fetch_description(obj, lang, page)
+
+
+def _prepare_report(report):
+    if report is not None:
+        report.setdefault("normalized", {})
+        report.setdefault("dropped", {})
+        report.setdefault("merged", {})
+
+
+def _report_input(report, lang, name, content):
+    # An input as it was last looked for: normalized to another title, or dropped if not found (or not answered for)
+    if report is None:
+        return
+
+    if content is not None and content["title"] != name:
+        report["normalized"].setdefault(lang, {})[name] = content["title"]
+    if content is None or content.get("pageid", -1) < 0:
+        report["dropped"].setdefault(lang, []).append(name)
+
+
+def _new_article(lang, content, links, target_langs):
+    # Article of a page found in `lang`, with its pages in the target langs (all langs if no target lang) among
+    # `links`, as `{lang: name}`
+    article = {
+        "query": {
+            "lang": lang,
+            "pid": content["pageid"],
+            "timestamp": datetime.datetime.today().isoformat(),
+            "duration": TARGET_DURATION,
+        },
+        # Add the query language in the list of langs
+        "langs": {
+            lang: {
+                "name": content["title"],
+                "description": _description(content),
+            }
+        },
+    }
+
+    # Add the other target langs
+    for other_lang in target_langs or links:
+        if other_lang != lang and other_lang in links:
+            article["langs"][other_lang] = {"name": links[other_lang]}
+
+    return article
+
+
+def resolved_queries(candidates, errors, report=None, descriptions=True):
+    """
+    Queries from the resolved articles, with equivalent articles merged into the first of them (see
+    dedup.merge_articles), keyed by its title.
+
+    `candidates` is a list of `((lang, input name), article)`, and `errors` holds the entries of the inputs that were
+    not found, by title, which are only kept if no article has the same title.
+    If `report` is a dict, `report["merged"]` is filled with the inputs merged into another article, per lang.
+    """
+    queries = {}
+    for article, sources in merge_articles(candidates):
+        lang = article["query"]["lang"]
+        title = article["langs"][lang]["name"]
+        if title in queries:  # Another article with the same title, in another lang
+            title = f"{title} ({lang})"
+        queries[title] = article
+
+        if report is not None:
+            for source_lang, name in sources[1:]:
+                report["merged"].setdefault(source_lang, {})[name] = title
+
+    for title, obj in errors.items():
+        if title not in queries:
+            queries[title] = obj
+
+    if VERBOSE:
+        qprint(queries)
+        if report is not None:
+            pprint(report)
+
+    if descriptions:
+        fetch_descriptions(queries)
+
+    return queries
+
+
+def fetch_data(to_find, target_langs=None, report=None, descriptions=True):
     # Check if the page exists, gather information if it does
     # https://www.mediawiki.org/wiki/API:Info
     # https://www.mediawiki.org/wiki/API:Langlinks
+    # If `report` is a dict, it is filled with the inputs that were normalized or dropped, per lang
     if target_langs is None:
         target_langs = DEFAULT_LANGS
 
-    queries = {}
+    # We group the queries per target lang for less queries, with at most TITLES_LIMIT names per query
+    batches = []
     for lang, names in to_find.items():
-        url_full = URL_INFOS.format(lang=lang)
-        # We group the queries per target lang for less queries
-        titles = "|".join(names)
-        params = {
-            "titles": titles,
-            "prop": "info|langlinks",
-            "lllimit": WIKI_LIMIT,  # We want all langs in order to find our target langs
-        }
+        names = sorted(names)  # Same chunks, so same URLs, from one run to another
+        for i in range(0, len(names), TITLES_LIMIT):
+            batches.append((lang, [({}, {"name": name}) for name in names[i : i + TITLES_LIMIT]]))
+
+    params = {
+        "prop": "info|langlinks|description|pageprops",
+        "lllimit": WIKI_LIMIT,  # We want all langs in order to find our target langs
+        "ppprop": "wikibase-shortdesc",
+    }
+    run_tasks(
+        (host_of(URL_INFOS, lang), query_batch, lang, batch, params, _merge_resolved, "could not resolve")
+        for lang, batch in batches
+    )
+
+    _prepare_report(report)
+
+    candidates = []  # ((lang, input name), article), in the order of the inputs
+    errors = {}
+    for lang, batch in batches:
+        for entry, input_page in batch:
+            content = entry.get("content")
+            _report_input(report, lang, input_page["name"], content)
+            if content is None:
+                continue
 
-        results = s.get(url=url_full, params=params)
-        data = results.json()
+            # Page was not found with that language
+            if content.get("pageid", -1) < 0:
+                errors.setdefault(content["title"], {"query": {"lang": lang}, "error": "not found"})
+                continue
 
-        if "query" in data and "pages" in data["query"]:
-            data = data["query"]["pages"]
+            links = {langlink["lang"]: langlink["*"] for langlink in content["langlinks"]}
+            candidates.append(((lang, input_page["name"]), _new_article(lang, content, links, target_langs)))
 
-        for pid, obj in data.items():
-            title = obj["title"]
+    # Merge linked pages with different names
+    # We assume here that pages are correctly linked (by Wikipedia) between each other
+    return resolved_queries(candidates, errors, report, descriptions)
 
-            # Will only keep the latest successful query for same name pages
-            queries[title] = {
-                "query": {
-                    "lang": lang,
-                }
-            }
 
-            # Page was not found with that language
-            if int(pid) < 0:
-                queries[title]["error"] = "not found"
-                continue
+def _merge_found(entry, page, content):
+    entry.setdefault("content", {}).update(content)
 
-            queries[title]["query"].update(
-                {
-                    "pid": int(pid),
-                    "timestamp": datetime.datetime.today().isoformat(),
-                    "duration": TARGET_DURATION,
-                }
-            )
 
-            # Add the query language in the list of langs
-            queries[title]["langs"] = {
-                lang: {
-                    "name": title,
-                }
-            }
+def _merge_langlinks(content, page, langlinks_content):
+    content.setdefault("langlinks", []).extend(langlinks_content.get("langlinks", []))
 
-            # Add the other target langs
-            if "langlinks" in obj:
-                for langlink in obj["langlinks"]:
-                    if not target_langs or langlink["lang"] in target_langs:  # Use all langs if no target lang
-                        queries[title]["langs"][langlink["lang"]] = {"name": langlink["*"]}
 
-    if VERBOSE:
-        qprint(queries)
+def _fetch_sitelinks(items, target_langs, sitelinks):
+    # https://www.wikidata.org/w/api.php?action=help&modules=wbgetentities
+    params = {
+        "action": "wbgetentities",
+        "ids": "|".join(items),
+        "props": "sitelinks",
+    }
+    if target_langs:  # Use all langs if no target lang
+        params["sitefilter"] = "|".join(f"{lang.replace('-', '_')}wiki" for lang in target_langs)
 
-    # Merge linked pages with different names
-    # We assume here that pages are correctly linked (by Wikipedia) between each other
-    next_queries = {}
-    for name, obj in queries.items():
-        if "error" in obj:
-            next_queries[name] = obj
+    data = get_json(URL_WIKIDATA, params)
+    for item, entity in data.get("entities", {}).items():
+        if "sitelinks" not in entity:  # Missing item, its pages fall back to their langlinks
             continue
 
-        skip = False
-        for _, page in obj["langs"].items():
-            if page["name"] in next_queries.keys():
-                skip = True
-                break
+        sitelinks[item] = {}
+        for site, sitelink in entity["sitelinks"].items():
+            lang = site[: -len("wiki")].replace("_", "-")
+            if site.endswith("wiki") and lang not in NON_WIKIPEDIA_SITES:
+                sitelinks[item][lang] = sitelink["title"]
 
-        if not skip:
-            next_queries[name] = obj
-    queries = next_queries
 
-    if VERBOSE:
-        qprint(queries)
+def fetch_data_wikidata(to_find, target_langs=None, report=None, descriptions=True):
+    # Same as fetch_data, but the other langs of an article come from the sitelinks of its Wikidata item
+    # https://www.mediawiki.org/wiki/API:Pageprops
+    # Names without a lang (see links_to_find with `expand=False`) are looked for in the target langs one after the
+    # other, and kept in the first one they exist in
+    # Pages without a Wikidata item fall back to their langlinks
+    if target_langs is None:
+        target_langs = DEFAULT_LANGS
 
-    # Dirty hack to get the short description don't judge me
-    for name, obj in queries.items():
-        if "error" in obj:
+    _prepare_report(report)
+
+    # Pages to look for, as (lang, name, position of the lang in the target langs, for names without a lang)
+    lookups = [(lang, name, None) for lang, names in to_find.items() if lang != "*" for name in sorted(names)]
+    if target_langs:
+        lookups += [(target_langs[0], name, 0) for name in sorted(to_find.get("*", []))]
+
+    params = {
+        "prop": "info|pageprops|description",
+        "ppprop": "wikibase_item|wikibase-shortdesc",
+    }
+    found = []  # (lang, input name, page), in the order they were looked for
+    while lookups:
+        per_lang = {}
+        for lang, name, position in lookups:
+            per_lang.setdefault(lang, []).append(({"position": position}, {"name": name}))
+        batches = [
+            (lang, entries[i : i + TITLES_LIMIT])
+            for lang, entries in per_lang.items()
+            for i in range(0, len(entries), TITLES_LIMIT)
+        ]
+        run_tasks(
+            (host_of(URL_INFOS, lang), query_batch, lang, batch, params, _merge_found, "could not resolve")
+            for lang, batch in batches
+        )
+
+        lookups = []
+        for lang, batch in batches:
+            for entry, input_page in batch:
+                # Not there, try the next target lang, it is only dropped once no lang is left
+                content = entry.get("content")
+                position = entry["position"]
+                if content is not None and content.get("pageid", -1) < 0:
+                    if position is not None and position + 1 < len(target_langs):
+                        lookups.append((target_langs[position + 1], input_page["name"], position + 1))
+                        continue
+
+                _report_input(report, lang, input_page["name"], content)
+                if content is not None:
+                    found.append((lang, input_page["name"], content))
+
+    # Sitelinks of the items, with at most TITLES_LIMIT items per query
+    # Page props may only hold the short description, for pages without an item
+    items = {content.get("pageprops", {}).get("wikibase_item") for _, _, content in found}
+    items = sorted(item for item in items if item is not None)
+    sitelinks = {}
+    run_tasks(
+        (host_of(URL_WIKIDATA, ""), _fetch_sitelinks, items[i : i + TITLES_LIMIT], target_langs, sitelinks)
+        for i in range(0, len(items), TITLES_LIMIT)
+    )
+
+    # Langlinks of the pages without an item, or whose item could not be fetched
+    per_lang = {}
+    for lang, _, content in found:
+        if content.get("pageid", -1) >= 0 and content.get("pageprops", {}).get("wikibase_item") not in sitelinks:
+            per_lang.setdefault(lang, []).append((content, {"name": content["title"], "pid": content["pageid"]}))
+    langlinks_params = {
+        "prop": "langlinks",
+        "lllimit": WIKI_LIMIT,
+    }
+    run_tasks(
+        (
+            host_of(URL_INFOS, lang),
+            query_batch,
+            lang,
+            pages[i : i + TITLES_LIMIT],
+            langlinks_params,
+            _merge_langlinks,
+            "could not resolve",
+        )
+        for lang, pages in per_lang.items()
+        for i in range(0, len(pages), TITLES_LIMIT)
+    )
+
+    candidates = []
+    errors = {}
+    for lang, name, content in found:
+        # Page was not found with that language
+        if content.get("pageid", -1) < 0:
+            errors.setdefault(content["title"], {"query": {"lang": lang}, "error": "not found"})
             continue
 
-        for lang, page in obj["langs"].items():
-            data = s.get(
-                url=f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{wiki_quote(page['name'])}?redirect=true"
-            ).json()
-            if "description" in data:
-                page["description"] = data["description"]
-            else:
-                page["description"] = None
+        item = content.get("pageprops", {}).get("wikibase_item")
+        if item in sitelinks:
+            links = sitelinks[item]
+        else:
+            links = {langlink["lang"]: langlink["*"] for langlink in content.get("langlinks", [])}
+
+        article = _new_article(lang, content, links, target_langs)
+        if item is not None:
+            article["query"]["wikidata"] = item
+        candidates.append(((lang, name), article))
+
+    # One article per item, or per set of linked pages
+    return resolved_queries(candidates, errors, report, descriptions)
+
+
+def fetch_descriptions(queries):
+    # Short descriptions of the pages that did not get theirs when resolved, TITLES_LIMIT pages per query
+    run_tasks(
+        (host_of(URL_INFOS, lang), _fetch_descriptions_batch, lang, batch) for lang, batch in batch_pages(queries)
+    )
 
     if VERBOSE:
         qprint(queries)
@@ -219,96 +748,86 @@ def fetch_data(to_find, target_langs=None):
     return queries
 
 
+def _fetch_backlinks_batch(lang, batch):
+    counters = {}
+    limit = BACKLINKS_COUNT_LIMIT if BACKLINKS_COUNT_ONLY else BACKLINKS_LIMIT
+
+    def merge(obj, page, content):
+        if "linkshere" in content:
+            backlinks = content["linkshere"][: limit - counters.get(page["name"], 0)]
+            if not BACKLINKS_COUNT_ONLY:
+                page.setdefault("backlinks", set()).update(backlink["title"] for backlink in backlinks)
+            counters[page["name"]] = counters.get(page["name"], 0) + len(backlinks)
+
+    params = {
+        "prop": "linkshere",
+        "lhprop": "pageid" if BACKLINKS_COUNT_ONLY else "title",  # Counting does not need the titles
+        "lhlimit": min(limit, WIKI_LIMIT),
+    }
+    query_batch(
+        lang,
+        batch,
+        params,
+        merge,
+        "could not retrieve information (backlinks)",
+        done=lambda page: counters.get(page["name"], 0) >= limit,
+        continued=continued_by_title,
+    )
+
+    for _, page in batch:
+        page["backlinks_count"] = counters.get(page["name"], 0)
+        if not BACKLINKS_COUNT_ONLY:
+            page["backlinks"] = list(page.get("backlinks", []))  # Sets are not valid JSON objects, lists are
+
+
 def fetch_backlinks(queries):
-    # Find the backlinks for each
+    # Find the backlinks for each, TITLES_LIMIT pages per query
     # For important pages (looking at you, "École polytechnique fédérale de Lausanne"), can take some time!
-    # Set BACKLINKS_LIMIT to control that.
-    # https://www.mediawiki.org/wiki/API:Backlinks
-    for name, obj in queries.items():
-        if "error" in obj:
-            continue
+    # Set BACKLINKS_LIMIT to control that, or set BACKLINKS_COUNT_ONLY to only count them, up to BACKLINKS_COUNT_LIMIT.
+    # https://www.mediawiki.org/wiki/API:Linkshere
+    run_tasks((host_of(URL_INFOS, lang), _fetch_backlinks_batch, lang, batch) for lang, batch in batch_pages(queries))
 
-        for lang, page in obj["langs"].items():
-            blcontinue = ""
-            blcounter = 0
-            url_full = URL_INFOS.format(lang=lang)
-
-            while blcounter < BACKLINKS_LIMIT:
-                params = {
-                    "list": "backlinks",
-                    "bltitle": page["name"],
-                    "bllimit": min(BACKLINKS_LIMIT, WIKI_LIMIT),
-                }
-                if blcontinue != "":
-                    params["blcontinue"] = blcontinue
-
-                results = s.get(url=url_full, params=params)
-                data = results.json()
-
-                if "query" in data and "backlinks" in data["query"]:
-                    bldata = data["query"]["backlinks"]
-                else:
-                    obj["error"] = "could not retrieve information (backlinks)"
-                    break
+    if VERBOSE:
+        qprint(queries)
 
-                if "backlinks" not in page:
-                    page["backlinks"] = set()  # This is to delete doubles
+    return queries
 
-                if bldata:
-                    for backlink in bldata:
-                        page["backlinks"].add(backlink["title"])
-                        blcounter += 1
 
-                if "continue" in data:
-                    blcontinue = data["continue"]["blcontinue"]
-                else:
-                    break
+def _merge_pageprops_revisions(obj, page, content):
+    if "revisions" not in content:
+        obj["error"] = "could not retrieve information (props)"
+        return
 
-            if "backlinks" in page and isinstance(page["backlinks"], set):
-                page["backlinks"] = list(page["backlinks"])  # Sets are not valid JSON objects, lists are
+    page["pid"] = content["pageid"]
+    if "pageprops" in content and "wikibase_item" in content["pageprops"]:
+        page["pwikidata"] = content["pageprops"]["wikibase_item"]
+    else:
+        page["pwikidata"] = None
+    page["creation"] = {
+        "timestamp": content["revisions"][0]["timestamp"],
+        "user": content["revisions"][0]["user"],
+    }
 
-    if VERBOSE:
-        qprint(queries)
 
-    return queries
+def _fetch_pageprops_revisions_batch(lang, batch):
+    params = {
+        "prop": "pageprops|revisions",
+        "rvlimit": 1,
+        "rvprop": "timestamp|user",
+        "rvdir": "newer",
+    }
+    query_batch(lang, batch, params, _merge_pageprops_revisions, "could not retrieve information (props)", follow=False)
 
 
 def fetch_pageprops_revisions(queries):
     # Get some of the missing information
     # https://www.mediawiki.org/wiki/API:Pageprops
     # https://www.mediawiki.org/wiki/API:Revisions
-    for name, obj in queries.items():
-        if "error" in obj:
-            continue
-
-        for lang, page in obj["langs"].items():
-            url_full = URL_INFOS.format(lang=lang)
-            params = {
-                "titles": page["name"],
-                "prop": "pageprops|revisions",
-                "rvlimit": 1,
-                "rvprop": "timestamp|user",
-                "rvdir": "newer",
-            }
-
-            results = s.get(url=url_full, params=params)
-            data = results.json()
-
-            if "query" in data and "pages" in data["query"]:
-                content = data["query"]["pages"]
-                pid = next(iter(content))
-                page["pid"] = int(pid)
-                content = content[pid]
-                if "pageprops" in content and "wikibase_item" in content["pageprops"]:
-                    page["pwikidata"] = content["pageprops"]["wikibase_item"]
-                else:
-                    page["pwikidata"] = None
-                page["creation"] = {
-                    "timestamp": content["revisions"][0]["timestamp"],
-                    "user": content["revisions"][0]["user"],
-                }
-            else:
-                obj["error"] = "could not retrieve information (props)"
+    # The first revision can only be asked for one page at a time (rvlimit and rvdir need a single page)
+    run_tasks(
+        (host_of(URL_INFOS, lang), _fetch_pageprops_revisions_batch, lang, batch)
+        for lang, batch in batch_pages(queries, size=1)
+    )
 
     if VERBOSE:
         qprint(queries)
@@ -316,57 +835,158 @@ def fetch_pageprops_revisions(queries):
     return queries
 
 
-def fetch_contributors(queries, target_contributors=None):
-    # Contributors
-    # https://www.mediawiki.org/wiki/API:Contributors
-    for name, obj in queries.items():
-        if "error" in obj:
-            continue
+def _fetch_contributors_batch(lang, batch, target_contributors=None):
+    counters = {}
 
-        for lang, page in obj["langs"].items():
-            pccontinue = ""
-            pccounter = 0
-            url_full = URL_INFOS.format(lang=lang)
-            params = {
-                "titles": page["name"],
-                "prop": "contributors",
-                "pclimit": min(CONTRIBS_LIMIT, WIKI_LIMIT),
-            }
+    def merge(obj, page, content):
+        if "contributors" not in page:
+            page["contributors"] = set()  # Data should already be a set, but I'm being cautious
 
-            while pccounter < CONTRIBS_LIMIT:
-                if pccontinue != "":
-                    params["pccontinue"] = pccontinue
+        if "contributors" in content:
+            contributors = content["contributors"][: CONTRIBS_LIMIT - counters.get(page["pid"], 0)]
+            page["contributors"].update(
+                [
+                    contributor["name"]
+                    for contributor in contributors
+                    if not target_contributors or contributor["name"] in target_contributors
+                    # Use all contributors if no target contributors are specified
+                ]
+            )
+            counters[page["pid"]] = counters.get(page["pid"], 0) + len(contributors)
+
+    params = {
+        "prop": "contributors",
+        "pclimit": min(CONTRIBS_LIMIT, WIKI_LIMIT),
+    }
+    query_batch(
+        lang,
+        batch,
+        params,
+        merge,
+        "could not retrieve information (contributors)",
+        done=lambda page: counters.get(page["pid"], 0) >= CONTRIBS_LIMIT,
+    )
+
+    for _, page in batch:
+        if "contributors" in page and isinstance(page["contributors"], set):
+            page["contributors"] = list(page["contributors"])  # Sets are not valid JSON objects, lists are
+
+
+def _fetch_editcounts(lang, users):
+    # https://www.mediawiki.org/wiki/API:Users
+    url_full = URL_INFOS.format(lang=lang)
+    editcounts = {}
+    for i in range(0, len(users), USERS_LIMIT):
+        params = {
+            "list": "users",
+            "ususers": "|".join(users[i : i + USERS_LIMIT]),
+            "usprop": "editcount",
+        }
+        data = get_json(url_full, params)
 
-                results = s.get(url=url_full, params=params)
-                data = results.json()
+        if "query" not in data or "users" not in data["query"]:
+            return None
+        for user in data["query"]["users"]:
+            if "editcount" in user:  # Not there for users that do not exist
+                editcounts[user["name"]] = user["editcount"]
 
-                if "query" in data and "pages" in data["query"]:
-                    pcdata = data["query"]["pages"][str(page["pid"])]
-                else:
-                    obj["error"] = "could not retrieve information (contributors)"
-                    break
+    return editcounts
 
-                if "contributors" not in page:
-                    page["contributors"] = set()  # Data should already be a set, but I'm being cautious
-
-                if pcdata:
-                    page["contributors"].update(
-                        [
-                            contributor["name"]
-                            for contributor in pcdata["contributors"]
-                            if not target_contributors or contributor["name"] in target_contributors
-                            # Use all contributors if no target contributors are specified
-                        ]
-                    )
-                    pccounter += len(pcdata["contributors"])
-
-                if "continue" in data:
-                    pccontinue = data["continue"]["pccontinue"]
-                else:
-                    break
 
-            if "contributors" in page and isinstance(page["contributors"], set):
-                page["contributors"] = list(page["contributors"])  # Sets are not valid JSON objects, lists are
+def _fetch_user_contributions(lang, users):
+    # Pages edited by each user, as `{title: {user, ...}}`
+    # https://www.mediawiki.org/wiki/API:Usercontribs
+    url_full = URL_INFOS.format(lang=lang)
+    edited = {}
+    for i in range(0, len(users), USERS_LIMIT):
+        params = {
+            "list": "usercontribs",
+            "ucuser": "|".join(users[i : i + USERS_LIMIT]),
+            "ucprop": "title",
+            "ucnamespace": 0,  # Articles only, as for the pages
+            "uclimit": WIKI_LIMIT,
+        }
+        continuation = {}
+        while True:
+            data = get_json(url_full, {**params, **continuation})
+
+            if "query" not in data or "usercontribs" not in data["query"]:
+                return None
+            for contribution in data["query"]["usercontribs"]:
+                edited.setdefault(contribution["title"], set()).add(contribution["user"])
+
+            if "continue" not in data:
+                break
+            continuation = data["continue"]
+
+    return edited
+
+
+def plan_contributors(lang, pages_count, target_contributors):
+    """
+    Find the target contributors of the `pages_count` pages of a lang from the contributions of the targets, if that
+    takes fewer requests than going through the contributors of every page (see CONTRIBUTORS_PER_PAGE).
+
+    Returns the pages edited by the targets, as `{title: {user, ...}}`, or None to go through the pages instead.
+    """
+    users = sorted(set(target_contributors))
+    # Pages are asked for in batches of TITLES_LIMIT, sharing the WIKI_LIMIT contributors of each answer
+    pages_requests = max(
+        math.ceil(pages_count / TITLES_LIMIT),
+        math.ceil(pages_count * min(CONTRIBUTORS_PER_PAGE, CONTRIBS_LIMIT) / WIKI_LIMIT),
+    )
+    users_requests = math.ceil(len(users) / USERS_LIMIT)
+    if pages_requests <= 2 * users_requests:  # Edit counts, then at least one request for their contributions
+        return None
+
+    editcounts = _fetch_editcounts(lang, users)
+    if editcounts is None:
+        return None
+
+    # Users without any edit can be left out, names as given by the API would not match the targets anyway
+    users = [user for user in users if editcounts.get(user)]
+    contributions_requests = sum(
+        max(1, math.ceil(sum(editcounts[user] for user in users[i : i + USERS_LIMIT]) / WIKI_LIMIT))
+        for i in range(0, len(users), USERS_LIMIT)
+    )
+    if contributions_requests >= pages_requests:
+        return None
+
+    return _fetch_user_contributions(lang, users)
+
+
+def _set_contributors(page, edited, target_contributors):
+    page["contributors"] = [user for user in edited.get(page["name"], []) if user in target_contributors]
+
+
+def fetch_contributors(queries, target_contributors=None):
+    # Contributors
+    # https://www.mediawiki.org/wiki/API:Contributors
+    # With target contributors, each lang goes through their contributions instead if it takes fewer requests
+    plans = {}
+    if target_contributors:
+        pages_counts = {}
+        for _, lang, _ in iter_pages(queries):
+            pages_counts[lang] = pages_counts.get(lang, 0) + 1
+        plans = dict(
+            zip(
+                pages_counts,
+                run_tasks(
+                    (host_of(URL_INFOS, lang), plan_contributors, lang, pages_count, target_contributors)
+                    for lang, pages_count in pages_counts.items()
+                ),
+            )
+        )
+
+    for _, lang, page in iter_pages(queries):
+        if plans.get(lang) is not None:
+            _set_contributors(page, plans[lang], target_contributors)
+
+    run_tasks(
+        (host_of(URL_INFOS, lang), _fetch_contributors_batch, lang, batch, target_contributors)
+        for lang, batch in batch_pages(queries)
+        if plans.get(lang) is None
+    )
 
     if VERBOSE:
         qprint(queries)
@@ -374,67 +994,177 @@ def fetch_contributors(queries, target_contributors=None):
     return queries
 
 
-def fetch_contributions(queries):
+def _fetch_contributions_page(obj, lang, page, previous_page=None):
+    rvcontinue = ""
+    url_full = URL_INFOS.format(lang=lang)
+    window_end = datetime.datetime.fromisoformat(obj["query"]["timestamp"])
+    window_start = window_end - datetime.timedelta(days=obj["query"]["duration"])
+    oldest = window_start.strftime(TIMESTAMP_FORMAT)
+    newest = window_end.strftime(TIMESTAMP_FORMAT)
+
+    # Whole days are asked for, so that the URL (and its cached response) stays the same through the day, the
+    # revisions are then trimmed to the window
+    first_day = datetime.datetime.combine(window_start.date(), datetime.time())
+    last_day = datetime.datetime.combine(window_end.date(), datetime.time())
+    params = {
+        "titles": page["name"],
+        "prop": "revisions",
+        "rvprop": "ids|timestamp|user|size|sha1",
+        "rvstart": (last_day + datetime.timedelta(days=1)).strftime(TIMESTAMP_FORMAT),
+        "rvend": first_day.strftime(TIMESTAMP_FORMAT),
+        "rvdir": "older",  # rvstart has to be later than rvend with that mode
+        "rvlimit": WIKI_LIMIT,
+    }
+
+    # Incremental mode: only ask for the revisions since the newest known one, if it is still in the window
+    known = None
+    if previous_page is not None and "contributions" in previous_page:
+        known = contributions_to_items(previous_page["contributions"])
+        if known:
+            params["rvend"] = max(params["rvend"], known[0]["timestamp"])  # Both as given by the API, comparable
+        known_revids = {item["revid"] for item in known}
+
+    items = []
+    while True:
+        if rvcontinue != "":
+            params["rvcontinue"] = rvcontinue
+
+        data = get_json(url_full, params)
+
+        if "query" in data and "pages" in data["query"] and "revisions" in data["query"]["pages"][str(page["pid"])]:
+            rvdata = data["query"]["pages"][str(page["pid"])]["revisions"]
+        elif known is not None and "query" in data and "pages" in data["query"]:
+            rvdata = []  # No new revision
+        else:
+            obj["error"] = "could not retrieve information (contributions)"
+            return
+
+        if rvdata:
+            for revision in rvdata:
+                if known is not None and revision["revid"] in known_revids:
+                    continue
+                if not oldest <= revision["timestamp"] <= newest:
+                    continue
+
+                items.append(
+                    {
+                        "revid": revision["revid"],
+                        "parentid": revision["parentid"],
+                        "timestamp": revision["timestamp"],
+                        "username": revision["user"],
+                        "size": revision["size"],
+                        "content": content_id(revision.get("sha1")),  # Missing when the revision is hidden
+                    }
+                )
+
+        if "continue" in data:
+            rvcontinue = data["continue"]["rvcontinue"]
+        else:
+            break
+
+    if known is not None:
+        # Keep the known revisions that are still in the window, newest first as the API gives them
+        items += [item for item in known if item["timestamp"] >= oldest]
+
+    page["contributions"] = contributions_from_items(items)
+
+
+def fetch_contributions(queries, previous=None):
     # Contributions
     # https://www.mediawiki.org/wiki/API:Revisions
-    for name, obj in queries.items():
-        if "error" in obj:
-            continue
+    # They are kept in columnar form, see columnar.contributions_from_items
+    # If `previous` (an older result) is given, only the new revisions are downloaded
+    previous = index_pages(previous)
+    run_tasks(
+        (
+            host_of(URL_INFOS, lang),
+            _fetch_contributions_page,
+            obj,
+            lang,
+            page,
+            find_previous_page(previous, obj, lang, page),
+        )
+        for obj, lang, page in iter_pages(queries)
+    )
 
-        for lang, page in obj["langs"].items():
-            rvcontinue = ""
-            url_full = URL_INFOS.format(lang=lang)
-            params = {
-                "titles": page["name"],
-                "prop": "revisions",
-                "rvprop": "ids|timestamp|user|size",
-                "rvstart": obj["query"]["timestamp"],
-                "rvend": (
-                    datetime.datetime.fromisoformat(obj["query"]["timestamp"])
-                    - datetime.timedelta(days=obj["query"]["duration"])
-                ).isoformat(),
-                "rvdir": "older",  # rvstart has to be later than rvend with that mode
-                "rvlimit": WIKI_LIMIT,
-            }
+    if VERBOSE:
+        qprint(queries)
 
-            while True:
-                if rvcontinue != "":
-                    params["rvcontinue"] = rvcontinue
+    return queries
 
-                results = s.get(url=url_full, params=params)
-                data = results.json()
 
-                if (
-                    "query" in data
-                    and "pages" in data["query"]
-                    and "revisions" in data["query"]["pages"][str(page["pid"])]
-                ):
-                    rvdata = data["query"]["pages"][str(page["pid"])]["revisions"]
-                else:
-                    obj["error"] = "could not retrieve information (contributions)"
-                    break
+def _fetch_pageviews_page(obj, lang, page, previous_page=None):
+    window_start = datetime.datetime.fromisoformat(obj["query"]["timestamp"]) - datetime.timedelta(
+        days=obj["query"]["duration"]
+    )
+    window_end = datetime.datetime.fromisoformat(obj["query"]["timestamp"])
+
+    # Incremental mode: only ask for the days after the last known one
+    known = None
+    start = window_start
+    if (
+        previous_page is not None
+        and "pageviews" in previous_page
+        and previous_page["pageviews"]["granularity"] == GRANULARITY
+    ):
+        oldest = window_start.strftime("%Y-%m-%dT00:00:00")
+        known = [item for item in pageviews_to_items(previous_page["pageviews"]) if item["timestamp"] >= oldest]
+        if known:
+            start = add_periods(datetime.datetime.fromisoformat(known[-1]["timestamp"]), 1, GRANULARITY)
+
+    if start.strftime("%Y%m%d") > window_end.strftime("%Y%m%d"):
+        data = {"items": []}  # Already up to date
+    else:
+        url_full = URL_STATS.format(
+            lang=lang,
+            access=ACCESS,
+            agent=AGENTS,
+            uri_article_name=wiki_quote(page["name"]),
+            granularity=GRANULARITY,
+            start=start.strftime("%Y%m%d00"),
+            end=window_end.strftime("%Y%m%d00"),
+        )
+
+        data = get_json(url_full)
+        if known is not None and str(data.get("type", "")).endswith("not_found"):
+            data = {"items": []}  # No new data yet, anything else is an error
+
+    if "items" in data:
+        items = (known or []) + [
+            {
+                "timestamp": datetime.datetime.strptime(item["timestamp"], "%Y%m%d%H").isoformat(),
+                "views": item["views"],
+            }
+            for item in data["items"]
+        ]
+        page["pageviews"] = {
+            "granularity": GRANULARITY,
+            "access": ACCESS,
+            "agent": AGENTS,
+            **pageviews_from_items(items, GRANULARITY),
+        }
+        page["pageviews_total"] = pageviews_total(page["pageviews"])
+    else:
+        obj["error"] = "could not retrieve information (pageviews)"
 
-                if "contributions" not in page:
-                    page["contributions"] = {
-                        "items": [],
-                    }
 
-                if rvdata:
-                    for revision in rvdata:
-                        page["contributions"]["items"].append(
-                            {
-                                "revid": revision["revid"],
-                                "parentid": revision["parentid"],
-                                "timestamp": revision["timestamp"],
-                                "username": revision["user"],
-                                "size": revision["size"],
-                            }
-                        )
-
-                if "continue" in data:
-                    rvcontinue = data["continue"]["rvcontinue"]
-                else:
-                    break
+def fetch_pageviews(queries, previous=None):
+    # Pageviews
+    # https://wikimedia.org/api/rest_v1/#/Pageviews%20data/get_metrics_pageviews_per_article__project___access___agent___article___granularity___start___end_
+    # They are kept as a series, see columnar.pageviews_from_items
+    # If `previous` (an older result) is given, only the new days are downloaded
+    previous = index_pages(previous)
+    run_tasks(
+        (
+            host_of(URL_STATS, lang),
+            _fetch_pageviews_page,
+            obj,
+            lang,
+            page,
+            find_previous_page(previous, obj, lang, page),
+        )
+        for obj, lang, page in iter_pages(queries)
+    )
 
     if VERBOSE:
         qprint(queries)
@@ -442,155 +1172,100 @@ def fetch_contributions(queries):
     return queries
 
 
-def fetch_pageviews(queries):
-    # Pageviews
-    # https://wikimedia.org/api/rest_v1/#/Pageviews%20data/get_metrics_pageviews_per_article__project___access___agent___article___granularity___start___end_
-    for name, obj in queries.items():
-        if "error" in obj:
-            continue
+def _merge_extract(obj, page, content):
+    if "extract" in content:
+        if "extract" not in page:
+            page["extract"] = ""
 
-        for lang, page in obj["langs"].items():
-            url_full = URL_STATS.format(
-                lang=lang,
-                access=ACCESS,
-                agent=AGENTS,
-                uri_article_name=wiki_quote(page["name"]),
-                granularity=GRANULARITY,
-                start=(
-                    datetime.datetime.fromisoformat(obj["query"]["timestamp"])
-                    - datetime.timedelta(days=obj["query"]["duration"])
-                ).strftime("%Y%m%d00"),
-                end=datetime.datetime.fromisoformat(obj["query"]["timestamp"]).strftime("%Y%m%d00"),
+        if content["extract"]:
+            page["extract"] += content["extract"]
+
+
+def _fetch_extract_batch(lang, batch):
+    params = {
+        "prop": "extracts",
+        "explaintext": 1,
+        "exsectionformat": "plain",
+    }
+    query_batch(lang, batch, params, _merge_extract, "could not retrieve information (extract)")
+
+    for obj, page in batch:
+        if "extract" not in page:
+            obj["error"] = "could not retrieve information (extract)"
+
+
+def get_stats_pool():
+    # Started on first use, "spawn" as forking a process running threads is not safe
+    global _stats_pool
+    with _stats_pool_lock:
+        if _stats_pool is None and STATS_WORKERS:
+            _stats_pool = ProcessPoolExecutor(
+                max_workers=STATS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=preload,
+                initargs=(DEFAULT_LANGS,),
             )
+        return _stats_pool
 
-            results = s.get(url=url_full)
-            data = results.json()
 
-            if "items" in data:
-                if "pageviews" not in page:
-                    page["pageviews"] = {
-                        "granularity": GRANULARITY,
-                        "access": ACCESS,
-                        "agent": AGENTS,
-                        "items": [],
-                    }
+def submit_text_stats(page, lang):
+    """
+    Compute the stats of the extract of a page in the stats pool, and return a future for `(stats, readability)`.
+    """
+    pool = get_stats_pool()
+    if pool is not None:
+        return pool.submit(text_stats, page["extract"], lang)
 
-                total_views = 0
-                for item in data["items"]:
-                    page["pageviews"]["items"].append(
-                        {
-                            "timestamp": datetime.datetime.strptime(item["timestamp"], "%Y%m%d%H").isoformat(),
-                            "views": item["views"],
-                        }
-                    )
-                    total_views += item["views"]
-                page["pageviews_total"] = total_views
-            else:
-                obj["error"] = "could not retrieve information (pageviews)"
-                continue
+    future = Future()
+    future.set_result(text_stats(page["extract"], lang))
+    return future
 
-    if VERBOSE:
-        qprint(queries)
 
-    return queries
+def _set_text_stats(page, result):
+    page["stats"], page["readability"] = result
 
 
 def fetch_text_and_stats(queries):
-    for name, obj in queries.items():
-        if "error" in obj:
-            continue
+    # Full extracts are only given one page at a time by the API
+    # https://www.mediawiki.org/wiki/Extension:TextExtracts#API
+    # Stats are computed in the stats pool while the next extracts are downloaded
+    futures = []
 
-        for lang, page in obj["langs"].items():
-            excontinue = ""
-            url_full = URL_INFOS.format(lang=lang)
-            params = {
-                "titles": page["name"],
-                "prop": "extracts",
-                "explaintext": 1,
-                "exsectionformat": "plain",
-            }
+    def fetch(lang, batch):
+        _fetch_extract_batch(lang, batch)
+        for _, page in batch:
+            if page.get("extract"):
+                futures.append((page, submit_text_stats(page, lang)))
 
-            while True:
-                if excontinue != "":
-                    params["excontinue"] = excontinue
+    run_tasks((host_of(URL_INFOS, lang), fetch, lang, batch) for lang, batch in batch_pages(queries, size=1))
 
-                results = s.get(url=url_full, params=params)
-                data = results.json()
+    for page, future in futures:
+        _set_text_stats(page, future.result())
 
-                if (
-                    "query" in data
-                    and "pages" in data["query"]
-                    and "extract" in data["query"]["pages"][str(page["pid"])]
-                ):
-                    exdata = data["query"]["pages"][str(page["pid"])]["extract"]
-                else:
-                    obj["error"] = "could not retrieve information (extract)"
-                    break
+    if VERBOSE:
+        qprint(queries)
 
-                if "extract" not in page:
-                    page["extract"] = ""
+    return queries
 
-                if exdata:
-                    page["extract"] += exdata
 
-                if "continue" in data:
-                    excontinue = data["continue"]["excontinue"]
-                else:
-                    break
+def _merge_page_assessments(obj, page, content):
+    if "pageassessments" in content:
+        page.setdefault("pageassessments", {}).update(content["pageassessments"])
 
-            if "extract" in page and page["extract"]:
-                # _, _, num_words, _, num_sentences = stats(page["extract"], lang)  # Legacy
-                page["stats"] = {
-                    "num_words": textstat.lexicon_count(page["extract"]),
-                    "num_sentences": textstat.sentence_count(page["extract"]),
-                    "reading_time": textstat.reading_time(page["extract"]),
-                }
-
-                # Using textstat
-                # Here, "min" means harder to read, while "max" means easier to read
-                # "minimum readability" vs. "maximum readability"
-                textstat.set_lang(lang)
-                page["readability"] = {
-                    "fres": {
-                        "name": "Flesch Reading Ease Score",
-                        "link": "https://en.wikipedia.org/wiki/Flesch%E2%80%93Kincaid_readability_tests#Flesch_reading_ease",
-                        "result": textstat.flesch_reading_ease(page["extract"]),
-                        "min": 0,
-                        "max": 100,
-                    }
-                }
-
-                if lang == "it":
-                    page["readability"]["it_gi"] = {
-                        "name": "Gulpease Index",
-                        "link": "https://it.wikipedia.org/wiki/Indice_Gulpease",
-                        "result": textstat.gulpease_index(page["extract"]),
-                        "min": 0,
-                        "max": 100,
-                    }
 
-                if lang == "de":
-                    page["readability"]["de_ws"] = {
-                        "name": "Wiener Sachtextformel",
-                        "link": "https://de.wikipedia.org/wiki/Lesbarkeitsindex#Wiener_Sachtextformel",
-                        "result": textstat.wiener_sachtextformel(page["extract"], 1),  # What are the variants?
-                        "min": 15,
-                        "max": 4,
-                    }
+def _fetch_page_assessments_batch(lang, batch):
+    params = {
+        "prop": "pageassessments",
+        "palimit": WIKI_LIMIT,
+    }
+    query_batch(lang, batch, params, _merge_page_assessments, "could not retrieve information (assessments)")
+
 
-                # Legacy
-                # page["readability"] = {
-                #     "fres": flesch(page["extract"], lang),
-                #     "fkgl": flesch_kincaid(page["extract"], lang),
-                #     "ari": automated_readability_index(page["extract"], lang),
-                #     "smog": smog_grade(page["extract"], lang),
-                #     "cli": coleman_liau_index(page["extract"], lang),
-                #     "gfi": gunning_fog_index(page["extract"], lang),
-                # }
-                # mean = 0
-                # for _, score in page["readability"].items():
-                #     mean += score
-                # page["readability"]["mean"] = mean / len(page["readability"])
+def fetch_page_assessments(queries):
+    # https://www.mediawiki.org/wiki/Extension:PageAssessments#API
+    run_tasks(
+        (host_of(URL_INFOS, lang), _fetch_page_assessments_batch, lang, batch) for lang, batch in batch_pages(queries)
+    )
 
     if VERBOSE:
         qprint(queries)
@@ -598,44 +1273,245 @@ def fetch_text_and_stats(queries):
     return queries
 
 
-def fetch_page_assessments(queries):
-    for name, obj in queries.items():
+class Batcher:
+    """
+    Gather the pages submitted to a batched stage, and run them per lang in batches of up to TITLES_LIMIT pages.
+
+    `expected` is the number of pages that will be submitted, per lang. A batch is sent as soon as it is full, when
+    every page still expected is waiting in it, or at the latest BATCH_LINGER seconds after its first page came in.
+    `run(lang, batch)` is a coroutine running the stage on a batch of `(obj, page)`. A page that will not be submitted
+    after all must be told with `skip(lang)`, so that the others don't wait for it.
+    """
+
+    def __init__(self, run, expected, size=TITLES_LIMIT):
+        self.run = run
+        self.expected = dict(expected)
+        self.size = size
+        self.pending = {}
+        self.timers = {}
+
+    def skip(self, lang):
+        self.expected[lang] -= 1
+        if self.pending.get(lang) and len(self.pending[lang]) >= self.expected[lang]:
+            self.flush(lang)
+
+    async def submit(self, obj, lang, page):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(lang, []).append((obj, page, future))
+
+        if len(self.pending[lang]) >= min(self.size, self.expected[lang]):
+            self.flush(lang)
+        elif lang not in self.timers:
+            self.timers[lang] = asyncio.get_running_loop().call_later(BATCH_LINGER, self.flush, lang)
+
+        await future
+
+    def flush(self, lang):
+        if lang in self.timers:
+            self.timers.pop(lang).cancel()
+        items = self.pending.pop(lang, [])
+        self.expected[lang] -= len(items)
+        if items:
+            asyncio.ensure_future(self.run_batch(lang, items))
+
+    async def run_batch(self, lang, items):
+        try:
+            await self.run(lang, [(obj, page) for obj, page, _ in items])
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+        else:
+            for _, _, future in items:
+                future.set_result(None)
+
+
+async def afetch_pages(queries, target_contributors=None, previous=None, on_event=None):
+    """
+    Run all the stages after `fetch_data`, each page going through them on its own.
+
+    Only the real dependencies are waited for: contributors, backlinks, contributions, extracts and assessments need
+    the page id given by the pageprops stage, everything else can start right away. As with the stages, a page whose
+    query is already in error is not processed further.
+    If given, `on_event(obj, lang, stage)` is called each time a stage is finished for a page, and with "done" once
+    the page went through all of them.
+    """
+    run = host_runner()
+    previous = index_pages(previous)
+    pages = list(iter_pages(queries))
+
+    expected = {}
+    for _, lang, _ in pages:
+        expected[lang] = expected.get(lang, 0) + 1
+    contributors = Batcher(
+        lambda lang, batch: run(host_of(URL_INFOS, lang), _fetch_contributors_batch, lang, batch, target_contributors),
+        expected,
+    )
+    assessments = Batcher(
+        lambda lang, batch: run(host_of(URL_INFOS, lang), _fetch_page_assessments_batch, lang, batch),
+        expected,
+    )
+    backlinks = Batcher(
+        lambda lang, batch: run(host_of(URL_INFOS, lang), _fetch_backlinks_batch, lang, batch),
+        expected,
+    )
+    descriptions = Batcher(
+        lambda lang, batch: run(host_of(URL_INFOS, lang), _fetch_descriptions_batch, lang, batch),
+        expected,
+    )
+    # With target contributors, each lang may find them from their contributions instead, planned right away
+    plans = {}
+    if target_contributors:
+        plans = {
+            lang: asyncio.ensure_future(
+                run(host_of(URL_INFOS, lang), plan_contributors, lang, pages_count, target_contributors)
+            )
+            for lang, pages_count in expected.items()
+        }
+
+    def notify(obj, lang, stage):
+        if on_event is not None:
+            on_event(obj, lang, stage)
+
+    async def stage(name, obj, lang, coroutine, batchers=()):
         if "error" in obj:
-            continue
+            coroutine.close()
+            for batcher in batchers:
+                batcher.skip(lang)
+            return
+        await coroutine
+        notify(obj, lang, name)
+
+    async def find_contributors(obj, lang, page):
+        edited = await plans[lang] if lang in plans else None
+        if edited is None:
+            await contributors.submit(obj, lang, page)
+        else:
+            _set_contributors(page, edited, target_contributors)
+
+    async def extract_and_stats(obj, lang, page):
+        await run(host_of(URL_INFOS, lang), _fetch_extract_batch, lang, [(obj, page)])
+        if page.get("extract"):
+            _set_text_stats(page, await asyncio.wrap_future(submit_text_stats(page, lang)))
+
+    async def chain(obj, lang, page):
+        previous_page = find_previous_page(previous, obj, lang, page)
+        host = host_of(URL_INFOS, lang)
+
+        async def with_pid():
+            await stage("pageprops", obj, lang, run(host, _fetch_pageprops_revisions_batch, lang, [(obj, page)]))
+            await asyncio.gather(
+                stage("contributors", obj, lang, find_contributors(obj, lang, page), [contributors]),
+                stage("backlinks", obj, lang, backlinks.submit(obj, lang, page), [backlinks]),
+                stage("contributions", obj, lang, run(host, _fetch_contributions_page, obj, lang, page, previous_page)),
+                stage("extract", obj, lang, extract_and_stats(obj, lang, page)),
+                stage("assessments", obj, lang, assessments.submit(obj, lang, page), [assessments]),
+            )
 
-        for lang, page in obj["langs"].items():
-            url_full = URL_INFOS.format(lang=lang)
-            params = {
-                "titles": page["name"],
-                "prop": "pageassessments",
-            }
+        await asyncio.gather(
+            stage("description", obj, lang, descriptions.submit(obj, lang, page), [descriptions]),
+            stage(
+                "pageviews",
+                obj,
+                lang,
+                run(host_of(URL_STATS, lang), _fetch_pageviews_page, obj, lang, page, previous_page),
+            ),
+            with_pid(),
+        )
+        notify(obj, lang, "done")
 
-            results = s.get(url=url_full, params=params)
-            data = results.json()
+    await asyncio.gather(*(chain(obj, lang, page) for obj, lang, page in pages))
 
-            print(data)
+    return queries
 
-            if (
-                "query" in data
-                and "pages" in data["query"]
-                and "pageassessments" in data["query"]["pages"][str(page["pid"])]
-            ):
-                page["pageassessments"] = data["query"]["pages"][str(page["pid"])]["pageassessments"]
 
+def fetch_pages(queries, target_contributors=None, previous=None, on_event=None):
+    """
+    Synchronous wrapper around `afetch_pages`.
+    """
+    asyncio.run(afetch_pages(queries, target_contributors, previous, on_event))
 
-def get_from_wikipedia(target_links, target_langs=None, target_contributors=None):
+    if VERBOSE:
+        qprint(queries)
+
+    return queries
+
+
+def stream_from_wikipedia(
+    target_links, target_langs=None, target_contributors=None, report=None, previous=None, partial=False
+):
+    """
+    Same as `get_from_wikipedia`, but yields the articles as soon as they are ready.
+
+    Yields `(title, lang, stage, obj)`, where `obj` is the entry of the article in the result.
+    `stage` is "done" (and `lang` is None) once the article went through all the stages.
+    If `partial` is set, `stage` is first "resolved" for every article once the titles are resolved, then the name of
+    each stage finished for one of its langs. In that case, `obj` keeps being filled until it is done.
+    Articles in error once resolved are done right away. An error of the fetching thread is raised here.
+    """
     if target_langs is None:
         target_langs = DEFAULT_LANGS
 
-    to_find = links_to_find(target_links, target_langs)
-    queries = fetch_data(to_find, target_langs)
-    fetch_backlinks(queries)
-    fetch_pageprops_revisions(queries)
-    fetch_contributors(queries, target_contributors)
-    fetch_contributions(queries)
-    fetch_pageviews(queries)
-    fetch_text_and_stats(queries)
-    fetch_page_assessments(queries)
+    if RESOLVE_WITH_WIKIDATA:
+        to_find = links_to_find(target_links, target_langs, expand=False)
+        queries = fetch_data_wikidata(to_find, target_langs, report, descriptions=False)
+    else:
+        to_find = links_to_find(target_links, target_langs)
+        queries = fetch_data(to_find, target_langs, report, descriptions=False)
+
+    titles = {id(obj): title for title, obj in queries.items()}
+    if partial:
+        for title, obj in queries.items():
+            yield title, None, "resolved", obj
+
+    remaining = {}  # Langs still running, per article
+    for title, obj in queries.items():
+        if "error" in obj:
+            yield title, None, "done", obj
+        else:
+            remaining[id(obj)] = len(obj["langs"])
+
+    events = queue.Queue()
+
+    # Called from the thread running the event loop
+    def on_event(obj, lang, stage):
+        if stage != "done":
+            if partial:
+                events.put((titles[id(obj)], lang, stage, obj))
+            return
+
+        remaining[id(obj)] -= 1
+        if remaining[id(obj)] == 0:
+            events.put((titles[id(obj)], None, "done", obj))
+
+    def work():
+        try:
+            fetch_pages(queries, target_contributors, previous, on_event)
+        except Exception as e:
+            events.put(e)
+        else:
+            events.put(None)
+
+    threading.Thread(target=work, daemon=True).start()
+
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        if isinstance(event, Exception):
+            raise event
+        yield event
+
+
+def get_from_wikipedia(target_links, target_langs=None, target_contributors=None, report=None, previous=None):
+    queries = {}
+    # Partial events are only used to keep the articles in the order they were resolved
+    for title, _, _, obj in stream_from_wikipedia(
+        target_links, target_langs, target_contributors, report, previous, partial=True
+    ):
+        queries[title] = obj
+
+    if VERBOSE and cache is not None:
+        pprint(cache.stats())
 
     return queries
 
@@ -664,10 +1540,8 @@ def main():
 
     queries = get_from_wikipedia(target_links, target_langs, target_contributors)
 
-    import json
-
-    with open("webapp/samples/results.json", "w", encoding="utf8") as f:
-        json.dump(queries, f, ensure_ascii=False, indent=4)
+    # Read back with result_file.ResultFile (or read_result)
+    write_result("webapp/samples/results.result", queries)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import requests
+
+
+EVICT_TARGET = 0.9  # Part of the maximum size left once the cache is evicted
+
+
+def endpoint_of(url):
+    """
+    Kind of endpoint queried by an URL, used to pick its time to live.
+    """
+    if "/metrics/pageviews/" in url:
+        return "pageviews"
+    if "/page/summary/" in url:
+        return "summary"
+    return "action"
+
+
+class ResponseCache:
+    """
+    On-disk cache of HTTP responses, using SQLite.
+
+    Each entry lives for the TTL (in seconds) of its endpoint kind, and the least recently used entries are evicted
+    when the cache goes over `max_size` bytes.
+    """
+
+    def __init__(self, path, ttls, max_size):
+        self.path = path
+        self.ttls = ttls
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Can be shared by several processes
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                expires REAL,
+                last_access REAL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+        # Running total of the sizes, so that inserting does not go through the whole table
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, url):
+        """
+        Return `(status, headers, body)` for a cached URL, or None.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT status, headers, body, expires FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None or row[3] < now:
+                self.misses += 1
+                return None
+
+            self.db.execute("UPDATE responses SET last_access = ? WHERE url = ?", (now, url))
+            self.hits += 1
+            return row[0], json.loads(row[1]), row[2]
+
+    def set(self, url, status, headers, body):
+        ttl = self.ttls.get(endpoint_of(url), 0)
+        if ttl <= 0 or len(body) > self.max_size:
+            return
+
+        now = time.time()
+        with self.lock:
+            replaced = self.db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, status, json.dumps(headers), body, len(body), now + ttl, now),
+            )
+            self.size += len(body) - (replaced[0] if replaced else 0)
+            if self.size > self.max_size:
+                self.evict(now)
+
+    def evict(self, now):
+        # Only called when over max_size: expired entries first, then the least recently used ones, down to
+        # EVICT_TARGET of max_size so that the next inserts do not come back here right away
+        # Other processes may share the file, so the running total is only trusted to know when to come here
+        self.db.execute("DELETE FROM responses WHERE expires < ?", (now,))
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        to_free = self.size - EVICT_TARGET * self.max_size
+        evicted = []
+        for url, entry_size in self.db.execute("SELECT url, size FROM responses ORDER BY last_access"):
+            if to_free <= 0:
+                break
+            evicted.append((url,))
+            to_free -= entry_size
+            self.size -= entry_size
+        self.db.executemany("DELETE FROM responses WHERE url = ?", evicted)
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size": size,
+        }
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter answering GET requests from a ResponseCache when possible.
+    """
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        cached = self.cache.get(request.url)
+        if cached is not None:
+            status, headers, body = cached
+            response = requests.Response()
+            response.status_code = status
+            response.headers = CaseInsensitiveDict(headers)
+            response.encoding = get_encoding_from_headers(response.headers)
+            response._content = body
+            response.url = request.url
+            response.request = request
+            response.connection = self
+            response.from_cache = True
+            return response
+
+        response = super().send(request, **kwargs)
+        response.from_cache = False
+        # Errors from the action API (such as maxlag) come with a 200 status, but must not be kept
+        if response.status_code == 200 and "MediaWiki-API-Error" not in response.headers:
+            headers = {
+                key: value
+                for key, value in response.headers.items()
+                if key.lower() not in ("content-encoding", "content-length", "transfer-encoding")  # Already decoded
+            }
+            self.cache.set(request.url, response.status_code, headers, response.content)
+
+        return response
@@ -0,0 +1,215 @@
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+
+
+try:
+    import fcntl
+except ImportError:  # Windows, jobs are then only capped per web process
+    fcntl = None
+
+
+from store import remove_old_files, save_result
+import get_from_wikipedia
+
+
+# Jobs are kept on disk, so that every web worker can follow them
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
+JOB_WORKERS = 2  # Per web process
+# Jobs running at the same time on the whole machine, whatever the number of web processes, and the processes each of
+# them can use for the text stats
+JOB_SLOTS = JOB_WORKERS
+JOB_STATS_WORKERS = max(1, (os.cpu_count() or 1) // JOB_SLOTS)
+# Python running the jobs. Under mod_wsgi, sys.executable is the web server itself, so the Python of the environment is
+# used instead, unless JOB_PYTHON is set
+if "python" in os.path.basename(sys.executable).lower():
+    JOB_PYTHON = os.environ.get("JOB_PYTHON", sys.executable)
+else:
+    JOB_PYTHON = os.environ.get("JOB_PYTHON", os.path.join(sys.exec_prefix, "bin", "python3"))
+JOB_HEARTBEAT = 10  # Seconds between two touches of the status of the jobs that a web process is running
+JOB_STALE = 6 * JOB_HEARTBEAT  # Seconds without a touch after which a job is lost, e.g. its web process was restarted
+JOBS_RETENTION = 24 * 3600  # Seconds the status of a job is kept for, None to keep them forever
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs = set()  # Ids of the jobs of this process not finished yet
+_heartbeat = None
+
+
+def get_executor():
+    # Started on first use, in the process that submits jobs
+    # "spawn", as forking a process running threads (such as a web server) is not safe
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            context = multiprocessing.get_context("spawn")
+            context.set_executable(JOB_PYTHON)
+            _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=context)
+        return _executor
+
+
+def _beat():
+    # Touch the status of the jobs of this process, so that they are not taken as lost (see job_status)
+    while True:
+        time.sleep(JOB_HEARTBEAT)
+        with _executor_lock:
+            job_ids = list(_jobs)
+        for job_id in job_ids:
+            try:
+                os.utime(_path(job_id, "status"))
+            except FileNotFoundError:
+                pass
+
+
+def _start_heartbeat():
+    global _heartbeat
+    with _executor_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, daemon=True)
+            _heartbeat.start()
+
+
+def _path(job_id, kind):
+    if len(job_id) != 32 or not all(c in "0123456789abcdef" for c in job_id):  # Job ids come from the browser
+        raise ValueError(f"invalid job id: {job_id}")
+    return os.path.join(JOBS_DIR, f"{job_id}.{kind}.json")
+
+
+def _write(job_id, kind, data):
+    # Write then rename, so that readers never see half a file
+    path = _path(job_id, kind)
+    with open(f"{path}.tmp", "w", encoding="utf8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def _read(job_id, kind):
+    try:
+        with open(_path(job_id, kind), encoding="utf8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+@contextmanager
+def job_slot():
+    """
+    Wait for one of the JOB_SLOTS of the machine, and hold it. Slots are lock files, shared by all the web processes,
+    and released by the system even if the process dies.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    while True:
+        for i in range(JOB_SLOTS):
+            f = open(os.path.join(JOBS_DIR, f"slot-{i}.lock"), "w")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:  # Taken
+                f.close()
+                continue
+
+            try:
+                yield
+            finally:
+                f.close()
+            return
+
+        time.sleep(1)
+
+
+def run_job(job_id, target_links):
+    """
+    Run an analysis, keeping its status up to date. Runs in a worker process, once a job slot is free.
+    """
+    get_from_wikipedia.STATS_WORKERS = JOB_STATS_WORKERS  # Before the stats pool of the process is started
+
+    with job_slot():
+        status = {"status": "running", "done": 0, "total": 0}
+        _write(job_id, "status", status)
+
+        try:
+            queries = {}
+            for title, _, stage, obj in get_from_wikipedia.stream_from_wikipedia(target_links, partial=True):
+                queries[title] = obj
+                if stage == "resolved":
+                    status["total"] += 1
+                elif stage == "done":
+                    status["done"] += 1
+                    _write(job_id, "status", status)
+
+            status.update({"status": "done", "result": save_result(queries)})
+        except Exception as e:
+            status.update({"status": "failed", "error": str(e)})
+
+        _write(job_id, "status", status)
+
+
+def submit_job(target_links):
+    """
+    Queue an analysis of `target_links` in the worker pool, and return its job id. Jobs older than JOBS_RETENTION are
+    removed meanwhile.
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    if JOBS_RETENTION is not None:
+        remove_old_files(JOBS_DIR, ".json", JOBS_RETENTION)
+        remove_old_files(JOBS_DIR, ".json.tmp", JOBS_RETENTION)
+    job_id = uuid.uuid4().hex
+    _write(job_id, "status", {"status": "queued", "done": 0, "total": 0})
+    _start_heartbeat()
+    with _executor_lock:
+        _jobs.add(job_id)
+
+    executor = get_executor()
+    executor.submit(run_job, job_id, target_links).add_done_callback(lambda future: _job_done(job_id, executor, future))
+
+    return job_id
+
+
+def _job_done(job_id, executor, future):
+    # run_job records its own errors, so an exception here means that the job could not run, e.g. its process died
+    global _executor
+    error = CancelledError() if future.cancelled() else future.exception()
+    with _executor_lock:
+        _jobs.discard(job_id)
+        if isinstance(error, BrokenProcessPool) and _executor is executor:
+            _executor = None  # Unusable, the next job starts a new one
+
+    if error is not None:
+        status = _read(job_id, "status") or {"done": 0, "total": 0}
+        status.update({"status": "failed", "error": str(error) or type(error).__name__})
+        _write(job_id, "status", status)
+
+
+def job_status(job_id):
+    """
+    Status of a job, as `{"status": "queued" | "running" | "done" | "failed", "done": ..., "total": ...}`, or None.
+
+    A job that is not finished, and whose status was not touched for JOB_STALE seconds, has failed.
+    """
+    status = _read(job_id, "status")
+    if status is not None and status["status"] in ("queued", "running"):
+        try:
+            if time.time() - os.path.getmtime(_path(job_id, "status")) > JOB_STALE:
+                status.update({"status": "failed", "error": "the job was lost, please try again"})
+        except FileNotFoundError:
+            pass
+
+    return status
+
+
+def job_result(job_id):
+    """
+    Id of the result of a finished job, in the result store, or None.
+    """
+    status = _read(job_id, "status")
+    return status.get("result") if status is not None else None
@@ -0,0 +1,50 @@
+import heapq
+
+
+RANKING_SIZE = 100  # Longest ranking kept, per language and metric
+
+# Metrics articles can be ranked on, as `metric: (label, value of a page)`
+METRICS = {
+    "pageviews": ("page views", lambda page: page.get("pageviews_total", 0)),
+    "edits": ("edits", lambda page: len(page["contributions"]["revid"]) if "contributions" in page else 0),
+    "contributors": ("contributors", lambda page: len(page.get("contributors", []))),
+    "backlinks": ("backlinks", lambda page: page.get("backlinks_count", len(page.get("backlinks", [])))),
+}
+
+
+def page_metrics(page):
+    """
+    Value of each metric for a page, as `{metric: value}`.
+    """
+    return {metric: value(page) for metric, (_, value) in METRICS.items()}
+
+
+def build_rankings(index, size=RANKING_SIZE):
+    """
+    Best `size` articles of a result index, for each language and metric, as `{lang: {metric: [(title, value)]}}`.
+
+    Articles with an error are left out, each language only needs a heap of `size` articles per metric.
+    """
+    values = {}
+    for title, entry in index.items():
+        if "error" in entry:
+            continue
+
+        for lang, metrics in entry.get("metrics", {}).items():
+            for metric, value in metrics.items():
+                values.setdefault(lang, {}).setdefault(metric, []).append((title, value))
+
+    return {
+        lang: {
+            metric: heapq.nlargest(size, articles, key=lambda article: article[1])
+            for metric, articles in metrics.items()
+        }
+        for lang, metrics in values.items()
+    }
+
+
+def top_k(rankings, lang, metric, k):
+    """
+    Best `k` articles for a language and metric, as `[(title, value)]`, best first.
+    """
+    return rankings.get(lang, {}).get(metric, [])[:k]
@@ -0,0 +1,180 @@
+from urllib.parse import urlparse
+import random
+import threading
+import time
+
+
+import requests
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT = (10, 60)  # Seconds to connect, and to wait for data, before retrying
+# Errors of the connection rather than of the request, worth retrying
+TRANSPORT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
+
+
+class TokenBucket:
+    """
+    Token bucket, refilled with `rate` tokens per second up to `capacity` tokens.
+
+    The whole bucket can also be paused, e.g. when the server asks us to come back later.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def refund(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, delay):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of requests in flight, and adapts that limit to the server.
+
+    The limit grows slowly while the (smoothed) latency stays close to the best one seen, shrinks when latency goes
+    up, and is halved when the server throttles us (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, initial, maximum, latency_tolerance=3.0):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.best_latency = None
+        self.latency = None
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def __exit__(self, *args):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def success(self, latency):
+        with self.condition:
+            if self.best_latency is None or latency < self.best_latency:
+                self.best_latency = latency
+            if self.latency is None:
+                self.latency = latency
+            self.latency = 0.8 * self.latency + 0.2 * latency  # Smoothed, single slow answers do not matter
+
+            if self.latency > self.latency_tolerance * self.best_latency:
+                self.limit = max(1.0, self.limit * 0.9)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def throttled(self):
+        with self.condition:
+            self.limit = max(1.0, self.limit / 2)
+
+
+class RequestScheduler:
+    """
+    Sends the requests of a session, with per-host rate limiting, retries and adaptive concurrency.
+
+    Throttling answers (HTTP 429 and 5xx, or a "maxlag" error from the action API) are retried with an exponential
+    backoff, honouring the `Retry-After` header, and pause the whole host meanwhile. Requests that fail on the way
+    (see TRANSPORT_ERRORS) are retried the same way, and their error raised once the retries are used up.
+    """
+
+    def __init__(self, session, rate, burst, max_concurrency, max_retries=5, backoff=1.0, timeout=REQUEST_TIMEOUT):
+        self.session = session
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (
+                    TokenBucket(self.rate, self.burst),
+                    AdaptiveLimiter(max(1, self.max_concurrency // 2), self.max_concurrency),
+                )
+            return self.hosts[host]
+
+    def delay(self, response, attempt):
+        delay = self.backoff * 2**attempt
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                delay = max(delay, float(response.headers["Retry-After"]))
+            except ValueError:  # Can also be a date, let's not bother
+                pass
+        return delay * random.uniform(1, 1.25)
+
+    def get(self, url, params=None):
+        bucket, limiter = self.host(url)
+
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                with limiter:
+                    start = time.monotonic()
+                    response = self.session.get(url=url, params=params, timeout=self.timeout)
+                    latency = time.monotonic() - start
+            except TRANSPORT_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                limiter.throttled()
+                bucket.pause(self.delay(None, attempt))
+                continue
+
+            if getattr(response, "from_cache", False):
+                bucket.refund()
+                return response
+
+            throttled = (
+                response.status_code in RETRY_STATUSES or response.headers.get("MediaWiki-API-Error") == "maxlag"
+            )
+            if not throttled:
+                limiter.success(latency)
+                return response
+
+            limiter.throttled()
+            if attempt < self.max_retries:
+                bucket.pause(self.delay(response, attempt))
+
+        return response
@@ -0,0 +1,117 @@
+from functools import lru_cache
+import threading
+
+
+from textstat.textstat import textstatistics
+
+
+SYLLABLES_CACHE_SIZE = 100_000  # Words, per language
+
+_analyzers = {}
+_analyzers_lock = threading.Lock()
+
+
+class Analyzer(textstatistics):
+    """
+    Readability analyzer for a single language, set once and for all when it is built.
+
+    Unlike textstat's global instance, it can be shared by threads, and it remembers the syllables of the words it saw.
+    """
+
+    def __init__(self, lang):
+        textstatistics.set_lang(self, lang)  # Loads the hyphenation dictionary
+        self.lang = lang
+        self.word_syllables = lru_cache(maxsize=SYLLABLES_CACHE_SIZE)(self._word_syllables)
+
+    def set_lang(self, lang):
+        raise TypeError(f"the language of an analyzer cannot be changed, use get_analyzer({lang!r})")
+
+    def _word_syllables(self, word):
+        return len(self.pyphen.positions(word)) + 1
+
+    def syllable_count(self, text, lang=None):
+        # Same as textstat's, with a memo per word rather than per text
+        if isinstance(text, bytes):
+            text = text.decode(self.text_encoding)
+        return sum(self.word_syllables(word) for word in self.remove_punctuation(text.lower()).split())
+
+
+def get_analyzer(lang):
+    """
+    Shared analyzer for a language, built on first use.
+    """
+    with _analyzers_lock:
+        if lang not in _analyzers:
+            _analyzers[lang] = Analyzer(lang)
+        return _analyzers[lang]
+
+
+def preload(langs):
+    """
+    Build the analyzers of `langs` ahead of time, e.g. when starting a worker process.
+    """
+    for lang in langs:
+        get_analyzer(lang)
+
+
+def text_stats(text, lang):
+    """
+    Compute the stats and readability scores of a text, as `(stats, readability)`.
+
+    This is CPU-bound, and meant to run in worker processes, but is also safe to call from threads.
+    """
+    textstat = get_analyzer(lang)
+
+    # _, _, num_words, _, num_sentences = stats(text, lang)  # Legacy
+    stats = {
+        "num_words": textstat.lexicon_count(text),
+        "num_sentences": textstat.sentence_count(text),
+        "reading_time": textstat.reading_time(text),
+    }
+
+    # Using textstat
+    # Here, "min" means harder to read, while "max" means easier to read
+    # "minimum readability" vs. "maximum readability"
+    readability = {
+        "fres": {
+            "name": "Flesch Reading Ease Score",
+            "link": "https://en.wikipedia.org/wiki/Flesch%E2%80%93Kincaid_readability_tests#Flesch_reading_ease",
+            "result": textstat.flesch_reading_ease(text),
+            "min": 0,
+            "max": 100,
+        }
+    }
+
+    if lang == "it":
+        readability["it_gi"] = {
+            "name": "Gulpease Index",
+            "link": "https://it.wikipedia.org/wiki/Indice_Gulpease",
+            "result": textstat.gulpease_index(text),
+            "min": 0,
+            "max": 100,
+        }
+
+    if lang == "de":
+        readability["de_ws"] = {
+            "name": "Wiener Sachtextformel",
+            "link": "https://de.wikipedia.org/wiki/Lesbarkeitsindex#Wiener_Sachtextformel",
+            "result": textstat.wiener_sachtextformel(text, 1),  # What are the variants?
+            "min": 15,
+            "max": 4,
+        }
+
+    # Legacy
+    # readability = {
+    #     "fres": flesch(text, lang),
+    #     "fkgl": flesch_kincaid(text, lang),
+    #     "ari": automated_readability_index(text, lang),
+    #     "smog": smog_grade(text, lang),
+    #     "cli": coleman_liau_index(text, lang),
+    #     "gfi": gunning_fog_index(text, lang),
+    # }
+    # mean = 0
+    # for _, score in readability.items():
+    #     mean += score
+    # readability["mean"] = mean / len(readability)
+
+    return stats, readability
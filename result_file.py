@@ -0,0 +1,171 @@
+from array import array
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+
+from ranking import page_metrics
+
+
+# File layout: header, then one compressed blob per part of each article, then the index
+#   header: MAGIC, offset and length of the index
+#   index: {title: {"table": ref, "langs": [...], "metrics": {lang: {metric: value}}, "error": ...}}
+#   table: where each part of the article is
+#   ref: [offset, length] for JSON, [offset, length, typecode] for an array of ints
+MAGIC = b"WAR\x01"
+HEADER = struct.Struct("<4sQQ")
+
+# Fields of a page kept apart, and only read when needed
+LAZY_FIELDS = ("contributions", "pageviews", "extract")
+# Columns stored as arrays of ints rather than JSON
+ARRAY_COLUMNS = {
+    ("contributions", "revid"): "q",
+    ("contributions", "parentid"): "q",
+    ("contributions", "timestamp"): "q",
+    ("contributions", "user"): "i",
+    ("contributions", "size"): "i",
+    ("contributions", "content"): "q",
+    ("contributions", "delta"): "i",
+    ("contributions", "revert"): "b",
+    ("pageviews", "views"): "q",
+}
+
+
+class _Writer:
+    def __init__(self, f):
+        self.f = f
+
+    def json(self, value):
+        return self.blob(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf8"))
+
+    def array(self, values, typecode):
+        try:
+            data = array(typecode, values)
+        except (TypeError, OverflowError):  # Not only ints, let's not lose anything
+            return self.json(values)
+        if sys.byteorder == "big":
+            data.byteswap()  # Always little-endian on disk
+        return self.blob(data.tobytes(), typecode)
+
+    def blob(self, data, typecode=None):
+        data = zlib.compress(data)
+        ref = [self.f.tell(), len(data)]
+        self.f.write(data)
+        return ref + [typecode] if typecode else ref
+
+    def part(self, field, value):
+        if not isinstance(value, dict):
+            return self.json(value)
+        return {
+            key: self.array(column, ARRAY_COLUMNS[(field, key)])
+            if (field, key) in ARRAY_COLUMNS and isinstance(column, list)
+            else self.json(column)
+            for key, column in value.items()
+        }
+
+    def page(self, page):
+        return {
+            "page": self.json({key: value for key, value in page.items() if key not in LAZY_FIELDS}),
+            "parts": {field: self.part(field, page[field]) for field in LAZY_FIELDS if field in page},
+        }
+
+
+def write_result(path, queries):
+    """
+    Write a result of get_from_wikipedia to `path`, in a binary format whose articles can be read one by one.
+    """
+    index = {}
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        writer = _Writer(f)
+
+        for title, obj in queries.items():
+            table = {"obj": writer.json({key: value for key, value in obj.items() if key != "langs"})}
+            index[title] = {}
+            if "error" in obj:
+                index[title]["error"] = obj["error"]
+            if "langs" in obj:
+                table["langs"] = {lang: writer.page(page) for lang, page in obj["langs"].items()}
+                index[title]["langs"] = list(obj["langs"])
+                index[title]["metrics"] = {lang: page_metrics(page) for lang, page in obj["langs"].items()}
+            index[title]["table"] = writer.json(table)
+
+        offset, length = writer.json(index)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, offset, length))
+
+    os.replace(f"{path}.tmp", path)  # Readers never see half a file
+
+
+class ResultFile:
+    """
+    Result written by write_result, of which only the index is read when opening.
+
+    Articles, and the heavy fields of their pages (see LAZY_FIELDS), are only decoded when asked for.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, offset, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"not a result file: {path}")
+        self.index = self._read([offset, length])
+
+    def _read(self, ref):
+        data = zlib.decompress(self.data[ref[0] : ref[0] + ref[1]])
+        if len(ref) == 2:
+            return json.loads(data)
+
+        values = array(ref[2])
+        values.frombytes(data)
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values.tolist()
+
+    def _read_part(self, ref):
+        if isinstance(ref, dict):
+            return {key: self._read(column) for key, column in ref.items()}
+        return self._read(ref)
+
+    def article(self, title, langs=None, fields=None):
+        """
+        One article, with only the languages in `langs` and the lazy fields in `fields` (all of them if None).
+        """
+        table = self._read(self.index[title]["table"])
+        obj = self._read(table["obj"])
+
+        if "langs" in table:
+            obj["langs"] = {}
+            for lang, refs in table["langs"].items():
+                if langs is not None and lang not in langs:
+                    continue
+
+                page = self._read(refs["page"])
+                for field, ref in refs["parts"].items():
+                    if fields is None or field in fields:
+                        page[field] = self._read_part(ref)
+                obj["langs"][lang] = page
+
+        return obj
+
+    def read_all(self):
+        return {title: self.article(title) for title in self.index}
+
+    def close(self):
+        self.data.close()
+
+
+def read_result(path):
+    """
+    Whole result from a file written by write_result.
+    """
+    result = ResultFile(path)
+    try:
+        return result.read_all()
+    finally:
+        result.close()
@@ -0,0 +1,90 @@
+from functools import lru_cache
+import os
+import time
+import uuid
+
+
+from ranking import build_rankings
+from result_file import ResultFile, write_result
+
+
+# Results are kept on disk, so that every web worker can read them, and the browser only holds their id
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+RESULTS_RETENTION = 7 * 24 * 3600  # Seconds a result is kept for, None to keep them forever
+
+
+def _path(result_id):
+    if (
+        not isinstance(result_id, str) or len(result_id) != 32 or not all(c in "0123456789abcdef" for c in result_id)
+    ):  # Result ids come from the browser
+        raise ValueError(f"invalid result id: {result_id}")
+    return os.path.join(RESULTS_DIR, f"{result_id}.result")
+
+
+@lru_cache(maxsize=32)
+def _open(result_id):
+    # Results never change once written, but may not exist yet: errors are not cached
+    return ResultFile(_path(result_id))
+
+
+def remove_old_files(directory, suffix, max_age):
+    """
+    Remove the files of `directory` ending with `suffix` that were not modified for `max_age` seconds.
+    """
+    now = time.time()
+    for entry in os.scandir(directory):
+        try:
+            if entry.name.endswith(suffix) and now - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+        except OSError:  # Removed meanwhile, or still open on Windows
+            pass
+
+
+def save_result(queries):
+    """
+    Store a result, and return its id. Results older than RESULTS_RETENTION are removed meanwhile.
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    if RESULTS_RETENTION is not None:
+        remove_old_files(RESULTS_DIR, ".result", RESULTS_RETENTION)
+        remove_old_files(RESULTS_DIR, ".tmp", RESULTS_RETENTION)  # Left by a crash while writing
+    result_id = uuid.uuid4().hex
+    write_result(_path(result_id), queries)
+
+    return result_id
+
+
+def load_index(result_id):
+    """
+    Articles of a result, as `{title: {"langs": [...], "metrics": ..., "error": ...}}`, or None. Not to be modified.
+    """
+    try:
+        return _open(result_id).index
+    except FileNotFoundError:
+        return None
+
+
+@lru_cache(maxsize=32)
+def load_rankings(result_id):
+    """
+    Rankings of the articles of a result, see ranking.build_rankings. Built once per result, not to be modified.
+    """
+    return build_rankings(_open(result_id).index)
+
+
+def load_article(result_id, title, langs=None, fields=None):
+    """
+    One article of a result, with only the languages in `langs` and the fields in `fields` (see
+    result_file.LAZY_FIELDS, all of them if None).
+    """
+    return _open(result_id).article(title, langs, fields)
+
+
+def load_result(result_id):
+    """
+    A whole result, as given by get_from_wikipedia, or None.
+    """
+    try:
+        return _open(result_id).read_all()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,41 @@
+from fake_wiki import FakeWiki
+import pytest
+
+
+from rate_limit import RequestScheduler
+import get_from_wikipedia
+
+
+@pytest.fixture
+def fake_wiki(monkeypatch):
+    """
+    Start a FakeWiki, and point the engine at it, without the response cache. Call it with the pages to serve.
+    """
+    wikis = []
+
+    def start(pages):
+        wiki = FakeWiki(pages)
+        wiki.start()
+        wikis.append(wiki)
+        monkeypatch.setattr(get_from_wikipedia, "URL_INFOS", wiki.url + "/{lang}/w/api.php")
+        monkeypatch.setattr(
+            get_from_wikipedia,
+            "URL_STATS",
+            wiki.url + "/pageviews/{lang}.wikipedia/{access}/{agent}/{uri_article_name}/{granularity}/{start}/{end}",
+        )
+        monkeypatch.setattr(
+            get_from_wikipedia, "URL_SUMMARY", wiki.url + "/{lang}/api/rest_v1/page/summary/{uri_article_name}"
+        )
+        monkeypatch.setattr(get_from_wikipedia, "URL_WIKIDATA", wiki.url + "/wikidata/w/api.php")
+        monkeypatch.setattr(get_from_wikipedia, "STATS_WORKERS", 0)  # Text stats in the fetching threads
+        monkeypatch.setattr(
+            get_from_wikipedia,
+            "scheduler",
+            RequestScheduler(get_from_wikipedia.get_session(), 1000, 1000, get_from_wikipedia.HOST_CONCURRENCY),
+        )
+        return wiki
+
+    yield start
+
+    for wiki in wikis:
+        wiki.stop()
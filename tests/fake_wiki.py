@@ -0,0 +1,287 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+import datetime
+import json
+import threading
+import time
+
+
+class FakeWiki:
+    """
+    Local stand-in for the APIs of a few Wikipedias, answering from `pages`: the action API under "/{lang}/w/api.php",
+    the REST summary under "/{lang}/api/rest_v1/page/summary/", the pageviews API under "/pageviews/" and the Wikidata
+    API under "/wikidata/w/api.php".
+
+    `pages` is `{lang: {title: page}}`, each page being a dict with "pid", and optionally "pageprops", "langlinks"
+    (`[{"lang", "*"}]`), "description", "linkshere" (titles), "contributors" (names), "revisions" (newest first, with
+    "timestamp" among their fields), "extract", "pageassessments" and "pageviews" (`{"YYYYMMDD": views}`).
+    The sitelinks of a Wikidata item are the pages whose "wikibase_item" page prop is that item, except for the items
+    in `deleted`, which are missing.
+    Continuation works as on the real API: "linkshere" shares its limit between the pages of a request, and goes
+    through them by title, continuing as "<title>|<from id>", or only "<from id>" for a single page. "contributors" does
+    the same by page id, continuing as "<page id>|<user id>".
+    Requests are kept in `requests`, as dicts of their parameters with their "lang". The next `stalls` requests are
+    only answered after `stall` seconds, and the next `truncations` ones get a truncated body.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+        self.stalls = 0
+        self.stall = 1.0
+        self.truncations = 0
+        self.deleted = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                lang = url.path.split("/")[1]
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                wiki.requests.append({"lang": lang, **params})
+                if wiki.stalls:
+                    wiki.stalls -= 1
+                    time.sleep(wiki.stall)
+
+                if lang == "wikidata":
+                    status, answer = 200, wiki.entities(params)
+                elif lang == "pageviews":
+                    status, answer = wiki.pageviews(*url.path.split("/")[2:])
+                elif url.path.split("/")[2] == "api":
+                    status, answer = wiki.summary(lang, url.path.split("/")[-1])
+                else:
+                    status, answer = 200, wiki.query(lang, params)
+
+                data = json.dumps(answer).encode("utf8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if wiki.truncations:
+                    wiki.truncations -= 1
+                    self.send_header("Content-Length", str(len(data) + 100))
+                else:
+                    self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def query(self, lang, params):
+        pages = self.pages.get(lang, {})
+        by_pid = {page["pid"]: title for title, page in pages.items()}
+        props = params.get("prop", "").split("|")
+
+        found = []
+        result = {}
+        normalized = []
+        if "pageids" in params:
+            for pid in params["pageids"].split("|"):
+                if int(pid) in by_pid:
+                    found.append(by_pid[int(pid)])
+                else:
+                    result[pid] = {"pageid": int(pid), "missing": ""}
+        else:
+            for i, title in enumerate(params["titles"].split("|")):
+                if "_" in title:
+                    normalized.append({"from": title, "to": title.replace("_", " ")})
+                    title = title.replace("_", " ")
+                if title in pages:
+                    found.append(title)
+                else:
+                    result[str(-1 - i)] = {"ns": 0, "title": title, "missing": ""}
+
+        found.sort(key=lambda title: pages[title]["pid"])
+        for title in found:
+            page = pages[title]
+            content = result[str(page["pid"])] = {"pageid": page["pid"], "ns": 0, "title": title}
+            if "pageprops" in props and page.get("pageprops"):
+                content["pageprops"] = page["pageprops"]
+            if "langlinks" in props and page.get("langlinks"):
+                content["langlinks"] = page["langlinks"]
+            if "description" in props and page.get("description"):
+                content["description"] = page["description"]
+            if "extracts" in props:
+                content["extract"] = page.get("extract", "")
+            if "pageassessments" in props and page.get("pageassessments"):
+                content["pageassessments"] = page["pageassessments"]
+
+        data = {"batchcomplete": "", "query": {"pages": result}}
+        if normalized:
+            data["query"]["normalized"] = normalized
+
+        if "linkshere" in props:
+            # The pages linking to a page have ids 1, 2, ... in the order of its "linkshere"
+            def position(title, from_id):
+                key = title.replace(" ", "_")
+                return f"{key}|{from_id}" if len(found) > 1 else str(from_id)
+
+            *start_key, start_id = params.get("lhcontinue", "|1").split("|")
+            start_key = "|".join(start_key)
+            budget = int(params.get("lhlimit", 10))
+            for title in sorted(found, key=lambda title: title.replace(" ", "_")):
+                page = pages[title]
+                key = title.replace(" ", "_")
+                if len(found) > 1 and key < start_key:
+                    continue
+
+                offset = int(start_id) - 1 if len(found) == 1 or key == start_key else 0
+                links = page.get("linkshere", [])[offset:]
+                if budget == 0:
+                    data["continue"] = {"lhcontinue": position(title, offset + 1), "continue": "||"}
+                    break
+
+                if links:
+                    result[str(page["pid"])]["linkshere"] = [{"title": link} for link in links[:budget]]
+                if len(links) > budget:
+                    data["continue"] = {"lhcontinue": position(title, offset + budget + 1), "continue": "||"}
+                    break
+                budget -= len(links)
+
+        if "contributors" in props:
+            # The contributors of a page have ids 1, 2, ... in the order of its "contributors"
+            start_pid, start_id = map(int, params.get("pccontinue", "0|1").split("|"))
+            budget = int(params.get("pclimit", 10))
+            for title in found:
+                page = pages[title]
+                if page["pid"] < start_pid:
+                    continue
+
+                offset = start_id - 1 if page["pid"] == start_pid else 0
+                contributors = page.get("contributors", [])[offset:]
+                if budget == 0:
+                    data["continue"] = {"pccontinue": f"{page['pid']}|{offset + 1}", "continue": "||"}
+                    break
+
+                if contributors:
+                    result[str(page["pid"])]["contributors"] = [{"name": name} for name in contributors[:budget]]
+                if len(contributors) > budget:
+                    data["continue"] = {"pccontinue": f"{page['pid']}|{offset + budget + 1}", "continue": "||"}
+                    break
+                budget -= len(contributors)
+
+        if "revisions" in props and found:
+            (title,) = found
+            if params.get("rvdir") == "newer":
+                revisions = [
+                    revision
+                    for revision in reversed(pages[title].get("revisions", []))
+                    if params.get("rvstart", "") <= revision["timestamp"] <= params.get("rvend", "9999")
+                ]
+            else:
+                revisions = [
+                    revision
+                    for revision in pages[title].get("revisions", [])
+                    if params.get("rvend", "") <= revision["timestamp"] <= params.get("rvstart", "9999")
+                ]
+            start = int(params.get("rvcontinue", 0))
+            limit = int(params.get("rvlimit", 1))
+            if revisions[start : start + limit]:  # No "revisions" at all otherwise
+                result[str(pages[title]["pid"])]["revisions"] = revisions[start : start + limit]
+            if start + limit < len(revisions):
+                data["continue"] = {"rvcontinue": str(start + limit), "continue": "||"}
+
+        return data
+
+    def entities(self, params):
+        sites = params["sitefilter"].split("|") if "sitefilter" in params else None
+        entities = {}
+        for item in params["ids"].split("|"):
+            sitelinks = {
+                f"{lang}wiki": {"site": f"{lang}wiki", "title": title}
+                for lang, pages in self.pages.items()
+                for title, page in pages.items()
+                if page.get("pageprops", {}).get("wikibase_item") == item
+            }
+            if item in self.deleted or not sitelinks:
+                entities[item] = {"id": item, "missing": ""}
+            else:
+                sitelinks = {site: link for site, link in sitelinks.items() if sites is None or site in sites}
+                entities[item] = {"type": "item", "id": item, "sitelinks": sitelinks}
+
+        return {"entities": entities, "success": 1}
+
+    def pageviews(self, project, access, agent, name, granularity, start, end):
+        page = self.pages.get(project.split(".")[0], {}).get(unquote(name).replace("_", " "), {})
+        items = [
+            {"project": project, "article": name, "granularity": granularity, "timestamp": f"{day}00", "views": views}
+            for day, views in sorted(page.get("pageviews", {}).items())
+            if start[:8] <= day <= end[:8]
+        ]
+        if not items:
+            return 404, {"type": "https://mediawiki.org/wiki/HyperSwitch/errors/not_found", "title": "Not found."}
+
+        return 200, {"items": items}
+
+    def summary(self, lang, name):
+        title = unquote(name).replace("_", " ")
+        if title not in self.pages.get(lang, {}):
+            return 404, {"type": "https://mediawiki.org/wiki/HyperSwitch/errors/not_found", "title": "Not found."}
+
+        page = self.pages[lang][title]
+        summary = {"title": title, "pageid": page["pid"]}
+        if page.get("description"):
+            summary["description"] = page["description"]
+        return 200, summary
+
+
+def sample_pages():
+    """
+    Pages of a few articles for a FakeWiki, with every field, dated relative to today.
+
+    "EPFL" (en) and "École polytechnique fédérale de Lausanne" (fr) share an item, as do "Martin Vetterli" (en and
+    de), "No item" (en) only has a langlink to "Sans élément" (fr).
+    """
+    now = datetime.datetime.combine(datetime.date.today(), datetime.time(12))
+
+    def page(pid, item=None, links=(), users=("Alice", "Bob")):
+        revisions = [
+            {
+                "revid": 100 * pid + i,
+                "parentid": 100 * pid + i - 1 if i else 0,
+                "timestamp": (now - datetime.timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "user": users[i % len(users)],
+                "size": 100 + 10 * i,
+                "sha1": f"{pid:x}{i:04x}",
+            }
+            for i, days in enumerate((1000, 300, 30, 2))  # The oldest one is out of the window
+        ][::-1]
+        return {
+            "pid": pid,
+            "pageprops": {"wikibase_item": item} if item else {},
+            "description": f"Description {pid}",
+            "linkshere": [f"Link {pid}-{i}" for i in range(3 * pid)],
+            "contributors": list(users),
+            "revisions": revisions,
+            "extract": "The school is in Lausanne. It was founded long ago, and it has many students.",
+            "pageassessments": {"Switzerland": {"class": "B", "importance": "High"}},
+            "pageviews": {
+                (now - datetime.timedelta(days=days)).strftime("%Y%m%d"): 10 + days for days in range(0, 60, 3)
+            },
+            "langlinks": list(links),
+        }
+
+    return {
+        "en": {
+            "EPFL": page(1, "Q1"),
+            "Martin Vetterli": page(2, "Q2", users=("Martin",)),
+            "No item": page(3, links=[{"lang": "fr", "*": "Sans élément"}]),
+        },
+        "fr": {
+            "École polytechnique fédérale de Lausanne": page(11, "Q1"),
+            "Sans élément": page(12),
+        },
+        "de": {"Martin Vetterli": page(21, "Q2", users=("Martin", "Carol"))},
+    }
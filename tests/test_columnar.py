@@ -0,0 +1,54 @@
+from columnar import (
+    contributions_from_items,
+    contributions_to_items,
+    pageviews_from_items,
+    pageviews_to_items,
+    pageviews_total,
+)
+
+
+def item(revid, parentid, size, content, username="A", timestamp="2024-01-01T00:00:00Z"):
+    return {
+        "revid": revid,
+        "parentid": parentid,
+        "timestamp": timestamp,
+        "username": username,
+        "size": size,
+        "content": content,
+    }
+
+
+def test_contributions_round_trip():
+    items = [item(3, 2, 30, 7, "B", "2024-01-03T10:00:00Z"), item(2, 1, 20, 8, "A", "2024-01-02T10:00:00Z")]
+
+    contributions = contributions_from_items(items)
+
+    assert contributions["users"] == ["B", "A"]
+    assert contributions["user"] == [0, 1]
+    assert contributions_to_items(contributions) == items
+
+
+def test_derive_contributions():
+    # Newest first: 4 reverts 3 back to the content of 2, 1 created the page
+    contributions = contributions_from_items(
+        [item(4, 3, 20, 22), item(3, 2, 25, 33), item(2, 1, 20, 22), item(1, 0, 10, 11)]
+    )
+
+    assert contributions["delta"] == [-5, 5, 10, 10]
+    assert contributions["revert"] == [1, 0, 0, 0]
+
+
+def test_delta_of_the_oldest_revision_with_an_unknown_parent():
+    contributions = contributions_from_items([item(9, 8, 50, 1), item(8, 5, 40, 2)])
+
+    assert contributions["delta"] == [10, 0]
+
+
+def test_pageviews_series():
+    items = [{"timestamp": "2024-01-01T00:00:00", "views": 3}, {"timestamp": "2024-01-03T00:00:00", "views": 5}]
+
+    pageviews = {**pageviews_from_items(items, "daily"), "granularity": "daily"}
+
+    assert pageviews["views"] == [3, 0, 5]
+    assert pageviews_total(pageviews) == 8
+    assert pageviews_to_items(pageviews)[1] == {"timestamp": "2024-01-02T00:00:00", "views": 0}
@@ -0,0 +1,43 @@
+from dedup import merge_articles
+
+
+def article(lang, pid, names, item=None):
+    query = {"lang": lang, "pid": pid}
+    if item is not None:
+        query["wikidata"] = item
+    return {"query": query, "langs": {page_lang: {"name": name} for page_lang, name in names.items()}}
+
+
+def test_merge_articles_sharing_a_page():
+    candidates = [
+        ("a", article("en", 1, {"en": "EPFL", "fr": "EPFL (fr)"})),
+        ("b", article("fr", 2, {"fr": "EPFL (fr)", "de": "EPFL (de)"})),
+        ("c", article("en", 3, {"en": "ETHZ"})),
+    ]
+
+    merged = merge_articles(candidates)
+
+    assert [sources for _, sources in merged] == [["a", "b"], ["c"]]
+    # The first article is kept, and completed with the langs of the others
+    assert merged[0][0]["query"]["pid"] == 1
+    assert merged[0][0]["langs"] == {"en": {"name": "EPFL"}, "fr": {"name": "EPFL (fr)"}, "de": {"name": "EPFL (de)"}}
+
+
+def test_merge_articles_transitively_and_by_item():
+    candidates = [
+        ("a", article("en", 1, {"en": "A"})),
+        ("b", article("de", 5, {"de": "B"}, item="Q1")),
+        ("c", article("fr", 2, {"fr": "C", "en": "A"}, item="Q1")),
+        ("d", article("en", 1, {"en": "A (redirect)"})),
+    ]
+
+    merged = merge_articles(candidates)
+
+    assert len(merged) == 1
+    assert merged[0][1] == ["a", "b", "c", "d"]
+
+
+def test_merge_articles_scales():
+    candidates = [(i, article("en", i % 10000, {"en": f"A{i % 10000}", "fr": f"F{i}"})) for i in range(30000)]
+
+    assert len(merge_articles(candidates)) == 10000
@@ -0,0 +1,402 @@
+import asyncio
+import datetime
+import threading
+import time
+
+
+from fake_wiki import sample_pages
+import pytest
+
+
+from columnar import pageviews_from_items
+from rate_limit import RequestScheduler
+import get_from_wikipedia
+
+
+def test_query_batch_stops_pages_at_their_limit(fake_wiki, monkeypatch):
+    monkeypatch.setattr(get_from_wikipedia, "BACKLINKS_LIMIT", 500)
+    wiki = fake_wiki(
+        {
+            "en": {
+                "Big": {"pid": 1, "linkshere": [f"Link {i}" for i in range(1200)]},
+                "Small": {"pid": 2, "linkshere": ["A", "B"]},
+                "Other": {"pid": 3, "linkshere": ["C"]},
+            }
+        }
+    )
+    batch = [({}, {"name": name, "pid": pid}) for name, pid in (("Big", 1), ("Small", 2), ("Other", 3))]
+
+    get_from_wikipedia._fetch_backlinks_batch("en", batch)
+
+    assert [page["backlinks_count"] for _, page in batch] == [500, 2, 1]
+    assert sorted(batch[1][1]["backlinks"]) == ["A", "B"]
+    # The first answer fills "Big", the continuation then restarts with the two other pages only
+    assert len(wiki.requests) == 2
+    assert wiki.requests[1]["pageids"] == "2|3"
+
+
+def test_backlinks_restart_follows_the_titles(fake_wiki, monkeypatch):
+    monkeypatch.setattr(get_from_wikipedia, "BACKLINKS_LIMIT", 500)
+    wiki = fake_wiki(
+        {
+            "en": {
+                "Zurich": {"pid": 1, "linkshere": ["A"]},
+                "Big": {"pid": 2, "linkshere": [f"Link {i}" for i in range(1200)]},
+                "Lonely": {"pid": 3, "linkshere": [f"Link {i}" for i in range(600)]},
+            }
+        }
+    )
+    batch = [({}, {"name": name, "pid": pid}) for name, pid in (("Zurich", 1), ("Big", 2))]
+    alone = [({}, {"name": "Lonely", "pid": 3})]
+
+    get_from_wikipedia._fetch_backlinks_batch("en", batch)
+    get_from_wikipedia._fetch_backlinks_batch("en", alone)
+
+    # "Big" comes first by title, then the restart only asks for "Zurich"
+    assert [page["backlinks_count"] for _, page in batch] == [1, 500]
+    assert [request["pageids"] for request in wiki.requests[:2]] == ["1|2", "1"]
+    # A single page stops as soon as it is done
+    assert alone[0][1]["backlinks_count"] == 500
+    assert len(wiki.requests) == 3
+
+
+def test_continued_by_title():
+    current, key = get_from_wikipedia.continued_by_title("10|Big_page|123")
+    assert current == (10, "Big_page")
+    assert key({"pageid": 1, "ns": 10, "title": "Template:Big page"}) == (10, "Big_page")
+
+    current, key = get_from_wikipedia.continued_by_title("Big_page|123")
+    assert current == "Big_page" and key({"pageid": 1, "ns": 0, "title": "Big page"}) == "Big_page"
+    assert key({"pageid": 1, "missing": ""}) is None
+
+    assert get_from_wikipedia.continued_by_title("123")[0] is None
+
+
+def test_fetch_data_merges_linked_inputs(fake_wiki):
+    fake_wiki(
+        {
+            "en": {"Lausanne": {"pid": 10, "langlinks": [{"lang": "fr", "*": "Lausanne (ville)"}]}},
+            "fr": {"Lausanne (ville)": {"pid": 20, "langlinks": [{"lang": "en", "*": "Lausanne"}]}},
+        }
+    )
+    report = {}
+
+    queries = get_from_wikipedia.fetch_data(
+        {"en": {"Lausanne"}, "fr": {"Lausanne_(ville)"}, "de": {"Nope"}}, ["en", "fr"], report, descriptions=False
+    )
+
+    assert list(queries) == ["Lausanne", "Nope"]
+    assert queries["Lausanne"]["langs"] == {
+        "en": {"name": "Lausanne", "description": None},
+        "fr": {"name": "Lausanne (ville)"},
+    }
+    assert queries["Nope"]["error"] == "not found"
+    assert report["normalized"] == {"fr": {"Lausanne_(ville)": "Lausanne (ville)"}}
+    assert report["merged"] == {"fr": {"Lausanne_(ville)": "Lausanne"}}
+
+
+def test_contributions_are_trimmed_to_the_window(fake_wiki, monkeypatch):
+    monkeypatch.setattr(get_from_wikipedia, "WIKI_LIMIT", 2)
+    revisions = [
+        {"revid": 5, "parentid": 4, "timestamp": "2024-01-10T12:00:00Z", "user": "B", "size": 30, "sha1": "a"},
+        {"revid": 4, "parentid": 3, "timestamp": "2024-01-09T12:00:00Z", "user": "A", "size": 20, "sha1": "b"},
+        {"revid": 3, "parentid": 2, "timestamp": "2024-01-08T12:00:00Z", "user": "B", "size": 10, "sha1": "a"},
+        {"revid": 2, "parentid": 1, "timestamp": "2024-01-07T12:00:00Z", "user": "A", "size": 5, "sha1": "c"},
+    ]
+    wiki = fake_wiki({"en": {"Page": {"pid": 1, "revisions": revisions}}})
+    obj = {"query": {"lang": "en", "pid": 1, "timestamp": "2024-01-10T06:00:00", "duration": 2}}
+    page = {"name": "Page", "pid": 1}
+
+    get_from_wikipedia._fetch_contributions_page(obj, "en", page)
+
+    # Whole days are asked for, in pages of WIKI_LIMIT revisions
+    assert len(wiki.requests) == 2
+    assert page["contributions"]["revid"] == [4, 3]
+    assert page["contributions"]["delta"] == [10, 0]  # Parent of the oldest one out of the window
+    assert page["contributions"]["users"] == ["A", "B"]
+
+
+def test_contributions_update_does_not_go_back_before_the_window(fake_wiki):
+    revisions = [
+        {"revid": 7, "parentid": 6, "timestamp": "2024-06-02T12:00:00Z", "user": "B", "size": 40, "sha1": "d"},
+        {"revid": 6, "parentid": 5, "timestamp": "2024-06-01T12:00:00Z", "user": "A", "size": 35, "sha1": "e"},
+        {"revid": 5, "parentid": 4, "timestamp": "2024-01-10T12:00:00Z", "user": "B", "size": 30, "sha1": "a"},
+    ]
+    wiki = fake_wiki({"en": {"Page": {"pid": 1, "revisions": revisions}}})
+    previous_page = {"name": "Page", "pid": 1}
+    obj = {"query": {"lang": "en", "pid": 1, "timestamp": "2024-01-10T18:00:00", "duration": 2}}
+    get_from_wikipedia._fetch_contributions_page(obj, "en", previous_page)
+    obj = {"query": {"lang": "en", "pid": 1, "timestamp": "2024-06-02T18:00:00", "duration": 2}}
+    page = {"name": "Page", "pid": 1}
+
+    get_from_wikipedia._fetch_contributions_page(obj, "en", page, previous_page)
+
+    # The newest known revision is older than the window, which starts the update
+    assert wiki.requests[-1]["rvend"] == "2024-05-31T00:00:00Z"
+    assert page["contributions"]["revid"] == [7, 6]
+
+
+def test_host_runner_runs_each_host_at_its_own_concurrency():
+    in_flight = []
+    lock = threading.Lock()
+    peak = [0]
+
+    def task():
+        with lock:
+            in_flight.append(None)
+            peak[0] = max(peak[0], len(in_flight))
+        time.sleep(0.2)
+        with lock:
+            in_flight.pop()
+
+    hosts = [f"test-host-{i}.example" for i in range(4)]
+    get_from_wikipedia.run_tasks((host, task) for host in hosts for _ in range(2 * get_from_wikipedia.HOST_CONCURRENCY))
+
+    assert peak[0] == len(hosts) * get_from_wikipedia.HOST_CONCURRENCY
+
+
+def test_names_without_lang_are_only_dropped_once_no_lang_is_left(fake_wiki):
+    fake_wiki({"en": {}, "fr": {"Martin Vetterli": {"pid": 1, "langlinks": [{"lang": "de", "*": "Martin Vetterli"}]}}})
+    report = {}
+
+    queries = get_from_wikipedia.fetch_data_wikidata(
+        {"*": {"Martin Vetterli", "Nobody"}}, ["en", "fr"], report, descriptions=False
+    )
+
+    assert queries["Martin Vetterli"]["query"]["lang"] == "fr"
+    assert list(queries["Martin Vetterli"]["langs"]) == ["fr"]
+    assert queries["Nobody"]["error"] == "not found"
+    assert report["dropped"] == {"fr": ["Nobody"]}
+
+
+def test_backlinks_stop_at_their_limit_without_page_ids(fake_wiki, monkeypatch):
+    monkeypatch.setattr(get_from_wikipedia, "BACKLINKS_LIMIT", 500)
+    wiki = fake_wiki(
+        {
+            "en": {
+                "Big": {"pid": 1, "linkshere": [f"Link {i}" for i in range(1200)]},
+                "Small": {"pid": 2, "linkshere": ["A"]},
+            }
+        }
+    )
+    queries = {
+        "Big": {"query": {"lang": "en"}, "langs": {"en": {"name": "Big"}}},
+        "Small": {"query": {"lang": "en"}, "langs": {"en": {"name": "Small"}}},
+    }
+
+    get_from_wikipedia.fetch_backlinks(queries)
+
+    assert queries["Big"]["langs"]["en"]["backlinks_count"] == 500
+    assert queries["Small"]["langs"]["en"]["backlinks"] == ["A"]
+    assert len(wiki.requests) == 2
+    assert wiki.requests[1]["titles"] == "Small"
+
+
+def test_batcher_does_not_wait_for_skipped_pages(monkeypatch):
+    monkeypatch.setattr(get_from_wikipedia, "BATCH_LINGER", 30)
+    batches = []
+
+    async def run(lang, batch):
+        batches.append((lang, [page["name"] for _, page in batch]))
+
+    async def main():
+        batcher = get_from_wikipedia.Batcher(run, {"en": 2})
+        submitted = asyncio.ensure_future(batcher.submit({}, "en", {"name": "A"}))
+        await asyncio.sleep(0)
+        batcher.skip("en")
+        await asyncio.wait_for(submitted, 1)
+
+    asyncio.run(main())
+
+    assert batches == [("en", ["A"])]
+
+
+def test_plan_contributors_counts_the_page_batches(monkeypatch):
+    editcounts = {}
+    monkeypatch.setattr(get_from_wikipedia, "_fetch_editcounts", lambda lang, users: editcounts)
+    monkeypatch.setattr(get_from_wikipedia, "_fetch_user_contributions", lambda lang, users: {"Page": {"A"}})
+
+    # 100 pages take about 20 requests for their contributors, 3 users with 12000 edits take 24
+    editcounts.update({"A": 4000, "B": 4000, "C": 4000})
+    assert get_from_wikipedia.plan_contributors("en", 100, ["A", "B", "C"]) is None
+
+    editcounts.update({"A": 1000, "B": 1000, "C": 1000})
+    assert get_from_wikipedia.plan_contributors("en", 100, ["A", "B", "C"]) == {"Page": {"A"}}
+
+
+INPUTS = [
+    "https://en.wikipedia.org/wiki/EPFL",
+    "fr.wikipedia.org/wiki/École_polytechnique_fédérale_de_Lausanne",
+    "Martin Vetterli",
+    "No item",
+    "Nobody",
+]
+
+
+def comparable(queries):
+    # Without the time of the query, and with the lists built from sets sorted
+    queries = {title: {**obj, "query": {**obj["query"]}} for title, obj in queries.items()}
+    for obj in queries.values():
+        obj["query"].pop("timestamp", None)
+        for page in obj.get("langs", {}).values():
+            for field in ("backlinks", "contributors"):
+                if field in page:
+                    page[field] = sorted(page[field])
+    return queries
+
+
+def test_stages_and_stream_give_the_same_result(fake_wiki):
+    fake_wiki(sample_pages())
+    langs = ["en", "fr", "de"]
+
+    by_stage = get_from_wikipedia.fetch_data_wikidata(
+        get_from_wikipedia.links_to_find(INPUTS, langs, expand=False), langs
+    )
+    for fetch in (
+        get_from_wikipedia.fetch_pageprops_revisions,
+        get_from_wikipedia.fetch_backlinks,
+        get_from_wikipedia.fetch_contributors,
+        get_from_wikipedia.fetch_contributions,
+        get_from_wikipedia.fetch_pageviews,
+        get_from_wikipedia.fetch_text_and_stats,
+        get_from_wikipedia.fetch_page_assessments,
+    ):
+        fetch(by_stage)
+    streamed = get_from_wikipedia.get_from_wikipedia(INPUTS, langs)
+
+    assert comparable(streamed) == comparable(by_stage)
+    assert list(streamed) == ["EPFL", "Martin Vetterli", "No item", "Nobody"]
+    assert streamed["Nobody"]["error"] == "not found"
+    assert list(streamed["EPFL"]["langs"]) == ["en", "fr"]
+    assert streamed["No item"]["langs"]["fr"]["name"] == "Sans élément"
+
+    page = streamed["Martin Vetterli"]["langs"]["de"]
+    assert page["description"] == "Description 21"
+    assert page["creation"] == {"timestamp": page["creation"]["timestamp"], "user": "Martin"}
+    assert page["backlinks_count"] == 63
+    assert sorted(page["contributors"]) == ["Carol", "Martin"]
+    assert page["contributions"]["revid"] == [2103, 2102, 2101]  # Without the one out of the window
+    assert page["pageviews_total"] == sum(10 + days for days in range(0, 60, 3))
+    assert page["pageassessments"] == {"Switzerland": {"class": "B", "importance": "High"}}
+    assert "stats" in page and "readability" in page
+
+
+def test_pages_of_a_missing_item_keep_their_langlinks(fake_wiki):
+    wiki = fake_wiki(
+        {
+            "en": {
+                "EPFL": {"pid": 1, "pageprops": {"wikibase_item": "Q1"}, "langlinks": [{"lang": "fr", "*": "EPFL"}]}
+            },
+            "fr": {"EPFL": {"pid": 11, "pageprops": {"wikibase_item": "Q1"}}},
+        }
+    )
+    wiki.deleted.add("Q1")
+
+    queries = get_from_wikipedia.fetch_data_wikidata({"en": {"EPFL"}}, ["en", "fr"], descriptions=False)
+
+    assert queries["EPFL"]["langs"]["fr"] == {"name": "EPFL"}
+
+
+def test_pageviews_update_only_takes_not_found_as_up_to_date(fake_wiki, monkeypatch):
+    wiki = fake_wiki({"en": {"EPFL": {"pid": 1}}})
+    now = datetime.datetime.now()
+    known = {
+        "granularity": "daily",
+        **pageviews_from_items([{"timestamp": now.strftime("%Y-%m-%dT00:00:00"), "views": 3}], "daily"),
+    }
+    obj = {
+        "query": {"lang": "en", "pid": 1, "timestamp": (now + datetime.timedelta(days=1)).isoformat(), "duration": 10}
+    }
+    page = {"name": "EPFL", "pid": 1}
+
+    get_from_wikipedia._fetch_pageviews_page(obj, "en", page, {"pageviews": known})
+    assert "error" not in obj and page["pageviews_total"] == 3
+
+    monkeypatch.setattr(
+        get_from_wikipedia, "scheduler", RequestScheduler(get_from_wikipedia.get_session(), 1000, 1000, 1, 1, 0.01)
+    )
+    wiki.truncations = 2  # Never answers properly
+    get_from_wikipedia._fetch_pageviews_page(obj, "en", page, {"pageviews": known})
+    assert obj["error"] == "could not retrieve information (pageviews)"
+
+
+def test_pages_wait_for_their_ids_and_share_batches(fake_wiki):
+    wiki = fake_wiki(sample_pages())
+    queries = get_from_wikipedia.fetch_data_wikidata({"en": {"EPFL", "Martin Vetterli", "No item"}}, ["en"])
+    events = []
+    wiki.requests.clear()
+
+    get_from_wikipedia.fetch_pages(
+        queries, on_event=lambda obj, lang, stage: events.append((obj["query"]["pid"], stage))
+    )
+
+    # Stages needing the page id only start once the pageprops stage gave it, so they ask by id
+    for pid in (1, 2, 3):
+        stages = [stage for event_pid, stage in events if event_pid == pid]
+        assert stages[-1] == "done"
+        assert set(stages) >= {"pageprops", "backlinks", "contributors", "contributions", "extract", "assessments"}
+        assert all(stages.index("pageprops") < stages.index(stage) for stage in ("backlinks", "contributors"))
+    props = {request.get("prop") for request in wiki.requests}
+    for prop in ("linkshere", "contributors", "pageassessments"):
+        (request,) = [request for request in wiki.requests if request.get("prop") == prop]  # One batch for all pages
+        assert sorted(request["pageids"].split("|")) == ["1", "2", "3"]
+    assert "description|pageprops" not in props  # Already known from the resolution
+
+
+def test_pages_in_error_do_not_hold_back_the_batches(fake_wiki, monkeypatch):
+    monkeypatch.setattr(get_from_wikipedia, "BATCH_LINGER", 30)
+    pages = sample_pages()
+    pages["en"]["No item"]["revisions"] = []  # Fails in the pageprops stage
+    wiki = fake_wiki(pages)
+    queries = get_from_wikipedia.fetch_data_wikidata({"en": {"EPFL", "No item"}}, ["en"], descriptions=False)
+    wiki.requests.clear()
+
+    start = time.monotonic()
+    get_from_wikipedia.fetch_pages(queries)
+
+    assert time.monotonic() - start < 10
+    assert queries["No item"]["error"] == "could not retrieve information (props)"
+    assert "backlinks_count" not in queries["No item"]["langs"]["en"]
+    assert queries["EPFL"]["langs"]["en"]["backlinks_count"] == 3
+    (request,) = [request for request in wiki.requests if request.get("prop") == "linkshere"]
+    assert request["pageids"] == "1"
+
+
+def test_stream_events(fake_wiki):
+    fake_wiki(sample_pages())
+
+    events = list(
+        get_from_wikipedia.stream_from_wikipedia(["Nobody", "EPFL", "Martin Vetterli"], ["en", "de"], partial=True)
+    )
+
+    titles = ["Nobody", "EPFL", "Martin Vetterli"]
+    stages = [stage for _, _, stage, _ in events]
+    assert sorted((title, stage) for title, _, stage, _ in events[:3]) == sorted(
+        (title, "resolved") for title in titles
+    )
+    assert events[3][:3] == ("Nobody", None, "done")  # Right away
+    assert "resolved" not in stages[3:]
+    assert sorted(title for title, _, stage, _ in events if stage == "done") == sorted(titles)
+    assert {(title, lang) for title, lang, stage, _ in events if stage == "backlinks"} == {
+        ("EPFL", "en"),
+        ("Martin Vetterli", "en"),
+        ("Martin Vetterli", "de"),
+    }
+    # An article is done after all the stages of its langs
+    for title in ("EPFL", "Martin Vetterli"):
+        positions = [i for i, (event_title, _, _, _) in enumerate(events) if event_title == title]
+        assert events[positions[-1]][2] == "done"
+        assert events[positions[-1]][3]["langs"]["en"]["backlinks_count"] > 0
+
+
+def test_stream_raises_the_errors_of_its_thread(fake_wiki, monkeypatch):
+    fake_wiki(sample_pages())
+
+    def fail(lang, batch):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(get_from_wikipedia, "_fetch_backlinks_batch", fail)
+    stream = get_from_wikipedia.stream_from_wikipedia(["EPFL"], ["en"])
+
+    with pytest.raises(RuntimeError, match="broken"):
+        list(stream)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+
+from webapp.helpers import filter_frame, lttb
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[500] = 100
+
+    selected = lttb(x, y, 20)
+
+    assert len(selected) == 20
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 500 in selected
+    assert (np.diff(selected) > 0).all()
+
+
+def test_lttb_short_series():
+    assert list(lttb(np.arange(5.0), np.arange(5.0), 10)) == [0, 1, 2, 3, 4]
+
+
+def test_filter_frame():
+    df = pd.DataFrame({"user": ["Alice", "Bob", "Carol"], "delta": [10, -5, 300]})
+
+    assert list(filter_frame(df, "{change} > 0", {"change": "delta"})["user"]) == ["Alice", "Carol"]
+    assert list(filter_frame(df, "{user} contains o && {delta} < 100")["user"]) == ["Bob"]
+    assert filter_frame(df, "") is df
+
+
+def test_filter_frame_text_operators_keep_numbers_as_text():
+    df = pd.DataFrame({"user": ["192.168.0.1", "Bob"], "date": ["2026-01-01 10:00", "2025-12-31 09:00"]})
+
+    assert list(filter_frame(df, "{user} contains 192")["user"]) == ["192.168.0.1"]
+    assert list(filter_frame(df, "{timestamp} contains 2026", {"timestamp": "date"})["user"]) == ["192.168.0.1"]
+    assert list(filter_frame(df, "{date} datestartswith 2025")["user"]) == ["Bob"]
+
+
+def test_filter_frame_ignores_display_columns():
+    df = pd.DataFrame({"user": ["Alice", "Bob"]})
+
+    assert list(filter_frame(df, "{links} contains diff && {user} eq Bob")["user"]) == ["Bob"]
@@ -0,0 +1,33 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import os
+import time
+
+
+import jobs
+
+
+def test_jobs_whose_process_died_have_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    job_id = "0" * 32
+    jobs._write(job_id, "status", {"status": "running", "done": 1, "total": 3})
+    future = Future()
+    future.add_done_callback(lambda future: jobs._job_done(job_id, None, future))
+
+    future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+
+    status = jobs.job_status(job_id)
+    assert status["status"] == "failed"
+    assert status["done"] == 1 and "terminated abruptly" in status["error"]
+
+
+def test_jobs_not_touched_for_long_are_lost(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    job_id = "1" * 32
+    jobs._write(job_id, "status", {"status": "queued", "done": 0, "total": 0})
+    assert jobs.job_status(job_id)["status"] == "queued"
+
+    old = time.time() - jobs.JOB_STALE - 1
+    os.utime(jobs._path(job_id, "status"), (old, old))
+
+    assert jobs.job_status(job_id)["status"] == "failed"
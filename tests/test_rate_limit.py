@@ -0,0 +1,47 @@
+from fake_wiki import FakeWiki
+
+
+from rate_limit import RequestScheduler
+import get_from_wikipedia
+
+
+def test_stalled_requests_are_retried():
+    wiki = FakeWiki({"en": {"Lausanne": {"pid": 10}}})
+    wiki.start()
+    wiki.stalls = 1
+    scheduler = RequestScheduler(get_from_wikipedia.get_session(), 1000, 1000, 1, backoff=0.01, timeout=(1, 0.2))
+
+    try:
+        response = scheduler.get(wiki.url + "/en/w/api.php", params={"action": "query", "titles": "Lausanne"})
+    finally:
+        wiki.stop()
+
+    assert response.json()["query"]["pages"]["10"]["title"] == "Lausanne"
+    assert len(wiki.requests) == 2
+
+
+def test_truncated_answers_are_retried():
+    wiki = FakeWiki({"en": {"Lausanne": {"pid": 10}}})
+    wiki.start()
+    wiki.truncations = 1
+    scheduler = RequestScheduler(get_from_wikipedia.get_session(), 1000, 1000, 1, backoff=0.01)
+
+    try:
+        response = scheduler.get(wiki.url + "/en/w/api.php", params={"action": "query", "titles": "Lausanne"})
+    finally:
+        wiki.stop()
+
+    assert response.json()["query"]["pages"]["10"]["title"] == "Lausanne"
+    assert len(wiki.requests) == 2
+
+
+def test_failed_requests_only_fail_their_pages(fake_wiki, monkeypatch):
+    wiki = fake_wiki({"en": {"Lausanne": {"pid": 10, "linkshere": ["EPFL"]}}})
+    scheduler = RequestScheduler(get_from_wikipedia.get_session(), 1000, 1000, 1, max_retries=1, backoff=0.01)
+    monkeypatch.setattr(get_from_wikipedia, "scheduler", scheduler)
+    wiki.truncations = 2
+    obj = {}
+
+    get_from_wikipedia._fetch_backlinks_batch("en", [(obj, {"name": "Lausanne", "pid": 10})])
+
+    assert obj["error"] == "could not retrieve information (backlinks)"
@@ -0,0 +1,43 @@
+from result_file import read_result, ResultFile, write_result
+
+
+QUERIES = {
+    "EPFL": {
+        "query": {"lang": "en", "pid": 1},
+        "langs": {
+            "en": {
+                "name": "EPFL",
+                "backlinks_count": 3,
+                "contributions": {"users": ["A"], "revid": [2, 1], "user": [0, 0], "revert": [0, 0], "size": [3, 1]},
+                "pageviews": {"start": "2024-01-01T00:00:00", "views": [1, 2], "granularity": "daily"},
+                "extract": "Text",
+            },
+            "fr": {"name": "EPFL (fr)"},
+        },
+    },
+    "Nope": {"query": {"lang": "de"}, "error": "not found"},
+}
+
+
+def test_round_trip(tmp_path):
+    write_result(tmp_path / "test.result", QUERIES)
+
+    assert read_result(tmp_path / "test.result") == QUERIES
+
+
+def test_index_and_lazy_fields(tmp_path):
+    write_result(tmp_path / "test.result", QUERIES)
+    result = ResultFile(tmp_path / "test.result")
+
+    try:
+        assert result.index["Nope"]["error"] == "not found"
+        assert result.index["EPFL"]["langs"] == ["en", "fr"]
+        assert result.index["EPFL"]["metrics"]["en"]["backlinks"] == 3
+        assert result.index["EPFL"]["metrics"]["en"]["edits"] == 2
+
+        article = result.article("EPFL", langs=["en"], fields=["pageviews"])
+        assert list(article["langs"]) == ["en"]
+        assert "contributions" not in article["langs"]["en"]
+        assert article["langs"]["en"]["pageviews"]["views"] == [1, 2]
+    finally:
+        result.close()
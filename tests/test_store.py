@@ -0,0 +1,17 @@
+import os
+import time
+
+
+import store
+
+
+def test_old_results_are_removed_when_saving(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "RESULTS_DIR", str(tmp_path))
+    old = store.save_result({"Nope": {"query": {"lang": "en"}, "error": "not found"}})
+    recent = store.save_result({"Nope": {"query": {"lang": "en"}, "error": "not found"}})
+    past = time.time() - store.RESULTS_RETENTION - 1
+    os.utime(store._path(old), (past, past))
+
+    new = store.save_result({})
+
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{result_id}.result" for result_id in (recent, new))
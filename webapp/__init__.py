@@ -12,7 +12,7 @@ app = Dash(
 
 app.layout = dbc.Container(
     [
-        dcc.Store(id="data", storage_type="session"),
+        dcc.Store(id="data", storage_type="session"),  # Id of the result, see store.py
         dcc.Location(id="url", refresh=True),
         dcc.Download(id="download"),
         # Header
@@ -2,8 +2,23 @@ import hashlib
 
 
 import iso639
+import numpy as np
+import pandas as pd
 
 
+PAGEVIEWS_FREQUENCIES = {"daily": "D", "monthly": "MS"}
+FILTER_OPERATORS = [
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+COMPARISON_OPERATORS = ("eq", "ne", "lt", "le", "gt", "ge")  # The only ones for which values can be numbers
+GRAPH_POINTS = 400  # Points of a series sent to the browser, for the whole series and again for the visible window
 LANGS = {"fr": "Français", "en": "English", "de": "Deutsch", "it": "Italiano"}
 QUALITY_IMPORTANCE_COLORS = {
     "FA": "#9CBDFF",
@@ -81,6 +96,165 @@ def map_score(value, min_value, max_value, min_score=1, max_score=6):
     return min_score + (scaled_value * span_score)
 
 
+def pageviews_frame(pageviews):
+    """
+    DataFrame of a pageviews series, with "timestamp" and "views" columns.
+    """
+    if not pageviews["views"]:
+        return pd.DataFrame({"timestamp": pd.DatetimeIndex([]), "views": []})
+
+    return pd.DataFrame(
+        {
+            "timestamp": pd.date_range(
+                pageviews["start"],
+                periods=len(pageviews["views"]),
+                freq=PAGEVIEWS_FREQUENCIES[pageviews["granularity"]],
+            ),
+            "views": pageviews["views"],
+        }
+    )
+
+
+def lttb(x, y, points):
+    """
+    Indexes of the `points` points that best keep the shape of a series, using Largest-Triangle-Three-Buckets.
+
+    https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+    """
+    length = len(x)
+    if points >= length or points < 3:
+        return np.arange(length)
+
+    # First and last points are kept, the others are split in `points - 2` buckets, each giving one point
+    edges = np.linspace(1, length - 1, points - 1).astype(np.int64)
+    selected = [0]
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (length - 1, length)
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        # Point making the largest triangle with the previous selected point and the mean of the next bucket
+        prev = selected[-1]
+        areas = np.abs((x[prev] - next_x) * (y[start:end] - y[prev]) - (x[prev] - x[start:end]) * (next_y - y[prev]))
+        selected.append(start + int(areas.argmax()))
+    selected.append(length - 1)
+
+    return np.array(selected)
+
+
+def downsample_frame(df, window=None, points=GRAPH_POINTS, y="views"):
+    """
+    Downsample a frame with a "timestamp" column to about `points` points, and as many within `window`, if given.
+
+    The whole series stays available coarsely (e.g. for the range slider), with more detail where the user looks.
+    """
+    x = df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.int64).astype(float)
+    values = df[y].to_numpy(dtype=float)
+    selected = lttb(x, values, points)
+
+    if window is not None:
+        start, end = df["timestamp"].searchsorted(list(window))
+        selected = np.union1d(
+            selected[(selected < start) | (selected >= end)], start + lttb(x[start:end], values[start:end], points)
+        )
+
+    return df.iloc[selected]
+
+
+def visible_window(relayout_data):
+    """
+    `(start, end)` of the x axis after the user zoomed a graph, or None when the whole series is shown.
+    """
+    if not relayout_data:
+        return None
+
+    if "xaxis.range" in relayout_data:
+        start, end = relayout_data["xaxis.range"]
+    elif "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        start, end = relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    else:
+        return None
+
+    return pd.Timestamp(start), pd.Timestamp(end)
+
+
+def edits_frame(contributions, days=1):
+    """
+    DataFrame of the number of edits per bin of `days` days, with "timestamp" and "edits" columns.
+    """
+    timestamps = np.asarray(contributions["timestamp"], dtype=np.int64)
+    if not len(timestamps):
+        return pd.DataFrame({"timestamp": pd.DatetimeIndex([]), "edits": []})
+
+    bins = timestamps // (days * 24 * 60 * 60)
+    first = bins.min()
+    counts = np.bincount(bins - first)
+
+    return pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime((first + np.arange(len(counts))) * days * 24 * 60 * 60, unit="s"),
+            "edits": counts,
+        }
+    )
+
+
+def split_filter_part(filter_part):
+    """
+    Column, operator and value of one part of a DataTable filter query, e.g. `{size} > 1000`.
+
+    https://dash.plotly.com/datatable/callbacks#backend-paging-with-filtering
+    """
+    for operators in FILTER_OPERATORS:
+        for operator in operators:
+            if operator not in filter_part:
+                continue
+
+            name_part, value_part = filter_part.split(operator, 1)
+            name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+
+            value_part = value_part.strip()
+            if value_part and value_part[0] == value_part[-1] and value_part[0] in ("'", '"', "`"):
+                value = value_part[1:-1].replace("\\" + value_part[0], value_part[0])
+            else:
+                value = value_part
+                if operators[0].strip() in COMPARISON_OPERATORS:  # "contains 192" is about text
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        pass
+
+            # Word operators need spaces after them in the filter string, but we don't want these later
+            return name, operators[0].strip(), value
+
+    return [None] * 3
+
+
+def filter_frame(df, filter_query, columns=None):
+    """
+    Rows of a frame matching a DataTable filter query. `columns` maps table columns to frame columns, if they differ.
+
+    Parts on columns that are not in the frame (e.g. made for display only) are ignored.
+    """
+    if not filter_query:
+        return df
+
+    columns = columns or {}
+    for filter_part in filter_query.split(" && "):
+        name, operator, value = split_filter_part(filter_part)
+        if name is None or columns.get(name, name) not in df:
+            continue
+
+        column = df[columns.get(name, name)]
+        if operator in COMPARISON_OPERATORS:
+            df = df.loc[getattr(column, operator)(value)]
+        elif operator == "contains":
+            df = df.loc[column.astype(str).str.contains(str(value), case=False, regex=False)]
+        elif operator == "datestartswith":
+            df = df.loc[column.astype(str).str.startswith(str(value))]
+
+    return df
+
+
 def create_main_fig(fig_main):
     fig_main.update_xaxes(
         rangeslider_visible=True,
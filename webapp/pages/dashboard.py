@@ -1,36 +1,61 @@
-import json
-
-
 from dash import callback, dcc, html, Input, Output, State
 from plotly import express as px
 from plotly import graph_objects as go
 import dash
 import dash_bootstrap_components as dbc
-import pandas as pd
 
 
 from get_from_wikipedia import DEFAULT_LANGS
-from webapp.helpers import create_main_fig, get_color
+from ranking import METRICS, RANKING_SIZE, top_k
+from store import load_article, load_rankings
+from webapp.helpers import create_main_fig, downsample_frame, get_color, pageviews_frame, visible_window
 
 
 dash.register_page(__name__)
 
+TOP_SIZES = [size for size in [5, 10, 20, 50, 100] if size <= RANKING_SIZE]
+
 layout = dbc.Container(
     [
         html.H2("Dashboard"),
         html.Br(),
         dbc.Row(
             [
-                html.H3("Top 5 pages"),
-                html.P("According to their number of page views."),
+                html.H3("Top pages"),
+                html.P("According to the chosen metric, with their page views."),
                 html.Ul([], id="top-names"),
                 dbc.Col(
                     [
-                        dcc.Dropdown(
-                            id="top-langs",
-                            options=DEFAULT_LANGS,
-                            value=DEFAULT_LANGS[0],
-                            clearable=False,
+                        dbc.Row(
+                            [
+                                dbc.Col(
+                                    dcc.Dropdown(
+                                        id="top-langs",
+                                        options=DEFAULT_LANGS,
+                                        value=DEFAULT_LANGS[0],
+                                        clearable=False,
+                                    )
+                                ),
+                                dbc.Col(
+                                    dcc.Dropdown(
+                                        id="top-metric",
+                                        options=[
+                                            {"label": label.capitalize(), "value": metric}
+                                            for metric, (label, _) in METRICS.items()
+                                        ],
+                                        value="pageviews",
+                                        clearable=False,
+                                    )
+                                ),
+                                dbc.Col(
+                                    dcc.Dropdown(
+                                        id="top-k",
+                                        options=TOP_SIZES,
+                                        value=TOP_SIZES[0],
+                                        clearable=False,
+                                    )
+                                ),
+                            ]
                         ),
                         html.Ol(id="debug"),
                         dcc.Graph(id="top-graph"),
@@ -63,42 +88,31 @@ layout = dbc.Container(
     Output("top-graph", "style"),
     Output("debug", "children"),
     Input("top-langs", "value"),
+    Input("top-metric", "value"),
+    Input("top-k", "value"),
+    Input("top-graph", "relayoutData"),
     State("data", "data"),
 )
-def update_top5(selected_lang, data):
+def update_top(selected_lang, selected_metric, k, relayout_data, data):
+    if dash.ctx.triggered_id == "top-graph" and not any(key.startswith("xaxis.") for key in relayout_data or {}):
+        return dash.no_update, dash.no_update, dash.no_update  # Not a zoom
+    window = visible_window(relayout_data)
+
     tops = []
-    for person, content in data.items():
-        if "error" in content:
-            print("error")
-            continue
-
-        for lang, obj in content["langs"].items():
-            if lang != selected_lang:
-                continue
-
-            if len(tops) < 5:
-                tops.append(
-                    {
-                        "name": obj["name"],
-                        "pageviews_total": obj["pageviews_total"],
-                        "pageviews_en": obj["pageviews"]["items"],  # "timestamp", "views"
-                    }
-                )
-            else:
-                # If last object has less pageview, replace
-                if obj["pageviews_total"] > tops[-1]["pageviews_total"]:
-                    tops[-1] = {
-                        "name": obj["name"],
-                        "pageviews_total": obj["pageviews_total"],
-                        "pageviews_en": obj["pageviews"]["items"],  # "timestamp", "views"
-                    }
-            tops = sorted(tops, key=lambda x: x["pageviews_total"])
-
-    tops = list(reversed(tops))
+    for title, value in top_k(load_rankings(data), selected_lang, selected_metric, k):
+        obj = load_article(data, title, [selected_lang], ["pageviews"])["langs"][selected_lang]
+        tops.append(
+            {
+                "name": obj["name"],
+                "value": value,
+                "pageviews_en": obj["pageviews"],  # "start", "granularity", "views"
+            }
+        )
+
     figs = list()
     for top in tops:
-        df = pd.read_json(json.dumps(top["pageviews_en"]))
-        fig_line = px.line(df, x="timestamp", y="views", hover_name=len(top["pageviews_en"]) * [top["name"]])
+        df = downsample_frame(pageviews_frame(top["pageviews_en"]), window)
+        fig_line = px.line(df, x="timestamp", y="views", hover_name=len(df) * [top["name"]])
         fig_line.update_traces(line_color=get_color(top["name"]))
         figs.append(fig_line)
 
@@ -106,17 +120,20 @@ def update_top5(selected_lang, data):
         figs = iter(figs)
         figs_data = next(figs).data
     except StopIteration:  # There is no data
-        return go.Figure(), {"display": "none"}  # , None
+        return go.Figure(), {"display": "none"}, []
 
     for fig in figs:
         figs_data += fig.data
 
     fig_main = go.Figure(data=figs_data)
 
+    if window is not None:
+        fig_main.update_xaxes(range=window)
+
     fig, style = create_main_fig(fig_main)
 
     return (
         fig,
         style,
-        [html.Li(f"{top['name']}: {top['pageviews_total']} views") for top in tops],
+        [html.Li(f"{top['name']}: {top['value']} {METRICS[selected_metric][0]}") for top in tops],
     )
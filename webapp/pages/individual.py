@@ -1,9 +1,8 @@
 from datetime import datetime
-import io
-import json
+from functools import lru_cache
 
 
-from dash import callback, Dash, dash_table, dcc, html, Input, Output, State
+from dash import callback, Dash, dash_table, dcc, html, Input, MATCH, Output, State
 from plotly import express as px
 from plotly import graph_objects as go
 import dash
@@ -11,8 +10,22 @@ import dash_bootstrap_components as dbc
 import pandas as pd
 
 
-from get_from_wikipedia import BACKLINKS_LIMIT, CONTRIBS_LIMIT
-from webapp.helpers import create_main_fig, get_color, get_lang_name, humantime_fmt, LANGS, map_score, sizeof_fmt
+from get_from_wikipedia import BACKLINKS_COUNT_LIMIT, BACKLINKS_LIMIT, CONTRIBS_LIMIT
+from store import load_article, load_index
+from webapp.helpers import (
+    create_main_fig,
+    downsample_frame,
+    edits_frame,
+    filter_frame,
+    get_color,
+    get_lang_name,
+    humantime_fmt,
+    LANGS,
+    map_score,
+    pageviews_frame,
+    sizeof_fmt,
+    visible_window,
+)
 
 
 dash.register_page(__name__)
@@ -81,8 +94,9 @@ layout = dbc.Container(
     Input("data", "data"),
 )
 def load_data(data):
-    if data is not None:
-        people = list(data.keys())
+    index = load_index(data) if data is not None else None
+    if index:  # Results are removed after RESULTS_RETENTION, see store.py
+        people = list(index)
         return people, people[0]
 
 
@@ -94,7 +108,7 @@ def load_data(data):
     State("data", "data"),
 )
 def change_person(person, data):
-    cur_data = data[person]
+    cur_data = load_index(data)[person]
 
     if "error" in cur_data:
         return [], "", f"Error with {person}"
@@ -113,14 +127,15 @@ def update_by_lang(selected_person, selected_langs, data):
     """
     Add a row to contain language details, such as contributions, for each language selected.
     """
-    if "error" in data[selected_person]:
-        return []
-
-    cur_data = data[selected_person]["langs"]
-
     if not isinstance(selected_langs, list):
         selected_langs = [selected_langs]
 
+    article = load_article(data, selected_person, selected_langs, [])
+    if "error" in article:
+        return []
+
+    cur_data = article["langs"]
+
     by_langs = []
     for lang in selected_langs:
         # Infos card
@@ -185,7 +200,9 @@ def update_by_lang(selected_person, selected_langs, data):
             )
 
         len_contributors = len(set(cur_data[lang]["contributors"]))
-        len_backlinks = len(set(cur_data[lang]["backlinks"]))
+        # Only counted if the titles were not kept, and with a higher limit then
+        len_backlinks = cur_data[lang].get("backlinks_count", len(set(cur_data[lang].get("backlinks", []))))
+        backlinks_limit = BACKLINKS_LIMIT if "backlinks" in cur_data[lang] else BACKLINKS_COUNT_LIMIT
         card = dbc.Card(
             [
                 dbc.CardHeader(f"{lang} - {LANGS[lang]}"),
@@ -217,8 +234,8 @@ def update_by_lang(selected_person, selected_langs, data):
                                 html.Dd(
                                     html.A(
                                         len_backlinks
-                                        if len_backlinks < BACKLINKS_LIMIT
-                                        else f"More than {BACKLINKS_LIMIT}",
+                                        if len_backlinks < backlinks_limit
+                                        else f"More than {backlinks_limit}",
                                         href=f"https://{lang}.wikipedia.org/wiki/Special:WhatLinksHere/{name.replace(' ', '_')}",
                                         target="_blank",
                                     )
@@ -233,36 +250,7 @@ def update_by_lang(selected_person, selected_langs, data):
             style={"width": "18rem"},
         )
 
-        # Contributions table
-        data = cur_data[lang]["contributions"]["items"]
-        data.reverse()
-
-        try:
-            prev_size = None
-            first_id = data[-1]["revid"]
-            for d in data:
-                d.update(
-                    {
-                        "timestamp": datetime.fromisoformat(d["timestamp"].replace("Z", "+00:00")).strftime(
-                            "%Y-%m-%d %H:%M"
-                        ),
-                        "change": sizeof_fmt(d["size"] - prev_size if prev_size else 0, sign=True),
-                    }
-                )
-                prev_size = d["size"]
-                d.update({"size": sizeof_fmt(d["size"])})
-
-                # Diff link
-                actu = (
-                    f"[actu](https://{lang}.wikipedia.org/w/index.php?title={name.replace(' ', '_')}&diff={first_id}&oldid={d['revid']})"
-                    if first_id != d["revid"]
-                    else "actu"
-                )
-                diff = f"[diff](https://{lang}.wikipedia.org/w/index.php?title={name.replace(' ', '_')}&diff=prev&oldid={d['revid']})"
-                d.update({"links": f"({actu} | {diff})"})
-        except TypeError:  # Already done
-            pass
-
+        # Contributions table, filled page by page by update_table
         columns = [
             {
                 "name": "Timestamp (UTC)",
@@ -275,10 +263,16 @@ def update_by_lang(selected_person, selected_langs, data):
             {
                 "name": "Size change",
                 "id": "change",
+                "type": "numeric",  # Filtered and sorted in bytes
             },
             {
                 "name": "Resulting size",
                 "id": "size",
+                "type": "numeric",
+            },
+            {
+                "name": "Revert",
+                "id": "revert",
             },
             {
                 "name": "",
@@ -292,11 +286,13 @@ def update_by_lang(selected_person, selected_langs, data):
                 dbc.CardBody(
                     [
                         dash_table.DataTable(
-                            id=f"table-{lang}",
-                            data=data,
+                            id={"type": "contributions-table", "lang": lang},
+                            data=[],
                             columns=columns,
-                            sort_action="native",
-                            filter_action="native",
+                            page_action="custom",
+                            sort_action="custom",
+                            filter_action="custom",
+                            page_current=0,
                             page_size=10,
                             style_cell_conditional=[
                                 {"if": {"column_id": "timestamp"}, "width": "40%"},
@@ -327,29 +323,116 @@ def update_by_lang(selected_person, selected_langs, data):
     return by_langs
 
 
+@lru_cache(maxsize=64)
+def contributions_frame(data, person, lang):
+    """
+    All the contributions of a page, oldest first, with the raw values used to sort and filter them.
+
+    Kept for the next interactions with the table, as results never change.
+    """
+    contributions = load_article(data, person, [lang], ["contributions"])["langs"][lang]["contributions"]
+    df = pd.DataFrame(
+        {
+            "revid": contributions["revid"],
+            "timestamp": contributions["timestamp"],
+            "username": [contributions["users"][user] for user in contributions["user"]],
+            "size": contributions["size"],
+            "change": contributions["delta"],
+            "revert": ["revert" if revert else "" for revert in contributions["revert"]],
+        }
+    ).iloc[::-1]
+
+    df["date"] = pd.to_datetime(df["timestamp"], unit="s").dt.strftime("%Y-%m-%d %H:%M")
+
+    return df.reset_index(drop=True)
+
+
+@callback(
+    Output({"type": "contributions-table", "lang": MATCH}, "data"),
+    Output({"type": "contributions-table", "lang": MATCH}, "page_count"),
+    Input({"type": "contributions-table", "lang": MATCH}, "page_current"),
+    Input({"type": "contributions-table", "lang": MATCH}, "page_size"),
+    Input({"type": "contributions-table", "lang": MATCH}, "sort_by"),
+    Input({"type": "contributions-table", "lang": MATCH}, "filter_query"),
+    State("person", "value"),
+    State("data", "data"),
+)
+def update_table(page_current, page_size, sort_by, filter_query, selected_person, data):
+    """
+    Filter, sort and page the contributions of a page server-side, and only send the visible rows.
+    """
+    lang = dash.ctx.outputs_list[0]["id"]["lang"]
+    name = load_article(data, selected_person, [lang], [])["langs"][lang]["name"]
+    contributions = contributions_frame(data, selected_person, lang)
+
+    # Timestamps are filtered as shown, but sorted as numbers
+    # Columns only made for display, such as the links, can be neither sorted nor filtered
+    df = filter_frame(contributions, filter_query, {"timestamp": "date"})
+    sort_by = [column for column in sort_by or [] if column["column_id"] in df]
+    if sort_by:
+        df = df.sort_values(
+            [column["column_id"] for column in sort_by],
+            ascending=[column["direction"] == "asc" for column in sort_by],
+            kind="stable",
+        )
+
+    page_count = max(1, -(-len(df) // page_size))
+    first_id = contributions["revid"].iloc[-1] if len(contributions) else None
+    title = name.replace(" ", "_")
+
+    rows = []
+    for row in df.iloc[page_current * page_size : (page_current + 1) * page_size].itertuples():
+        # Diff link
+        actu = (
+            f"[actu](https://{lang}.wikipedia.org/w/index.php?title={title}&diff={first_id}&oldid={row.revid})"
+            if first_id != row.revid
+            else "actu"
+        )
+        diff = f"[diff](https://{lang}.wikipedia.org/w/index.php?title={title}&diff=prev&oldid={row.revid})"
+        rows.append(
+            {
+                "timestamp": row.date,
+                "username": row.username,
+                "change": sizeof_fmt(row.change, sign=True),
+                "size": sizeof_fmt(row.size),
+                "revert": row.revert,
+                "links": f"({actu} | {diff})",
+            }
+        )
+
+    return rows, page_count
+
+
 @callback(
     Output("graph", "figure"),
     Output("graph", "style"),
     State("person", "value"),
     Input("langs", "value"),
+    Input("graph", "relayoutData"),
     State("data", "data"),
 )
-def update_graph(selected_person, selected_langs, data):
+def update_graph(selected_person, selected_langs, relayout_data, data):
     """
     Update the graph with one or multiple languages.
-    """
-    if "error" in data[selected_person]:
-        return go.Figure(), {"display": "none"}
 
-    cur_data = data[selected_person]["langs"]
+    Page views are downsampled, and fetched again with more detail when the user zooms in.
+    """
+    if dash.ctx.triggered_id == "graph" and not any(key.startswith("xaxis.") for key in relayout_data or {}):
+        return dash.no_update, dash.no_update  # Not a zoom
+    window = visible_window(relayout_data)
 
     if not isinstance(selected_langs, list):
         selected_langs = [selected_langs]
 
+    article = load_article(data, selected_person, selected_langs, ["pageviews", "contributions"])
+    if "error" in article:
+        return go.Figure(), {"display": "none"}
+
+    cur_data = article["langs"]
+
     figs = list()
     for lang in selected_langs:
-        pageviews_en = cur_data[lang]["pageviews"]["items"]  # "timestamp", "views"
-        df = pd.read_json(io.StringIO(json.dumps(pageviews_en)))
+        df = downsample_frame(pageviews_frame(cur_data[lang]["pageviews"]), window)
 
         fig_line = px.line(df, x="timestamp", y="views", hover_name=len(df) * [get_lang_name(lang)])
         fig_line.update_traces(line_color=get_color(lang))
@@ -366,9 +449,21 @@ def update_graph(selected_person, selected_langs, data):
 
     fig_main = go.Figure(data=figs_data)
 
+    # Edit activity, as one bar per day rather than one line per edit
     for lang in selected_langs:
-        contributions = cur_data[lang]["contributions"]["items"]
-        for contrib in contributions:
-            fig_main.add_vline(x=contrib["timestamp"], line_dash="dash", line_color=get_color(lang))
+        df = edits_frame(cur_data[lang]["contributions"])
+        fig_main.add_trace(
+            go.Bar(
+                x=df["timestamp"],
+                y=df["edits"],
+                name=f"Edits ({lang})",
+                marker_color=get_color(lang),
+                opacity=0.5,
+                yaxis="y2",
+            )
+        )
+    fig_main.update_layout(yaxis2=dict(title="Edits", overlaying="y", side="right", showgrid=False))
+    if window is not None:
+        fig_main.update_xaxes(range=window)
 
     return create_main_fig(fig_main)
@@ -9,7 +9,8 @@ import dash_bootstrap_components as dbc
 import requests
 
 
-from get_from_wikipedia import get_from_wikipedia
+from jobs import job_result, job_status, submit_job
+from store import load_result
 
 
 dash.register_page(__name__, path="/")
@@ -65,16 +66,13 @@ layout = dbc.Container(
             ]
         ),
         # Result
+        dcc.Store(id="job"),
+        dcc.Interval(id="job-poll", interval=1000, disabled=True),
         html.Center(dbc.Spinner(html.Div(id="spinner"), id="spinner-out", color="primary")),
         html.Div(
             [
                 html.Hr(),
                 html.H2("Resulting query"),
-                dbc.Textarea(
-                    id="queries-text",
-                    className="mb-3",
-                    placeholder="{}",
-                ),
                 html.Center(
                     [
                         html.A(dbc.Button("Global dashboard", size="lg", className="me-1"), href="dashboard"),
@@ -90,24 +88,24 @@ layout = dbc.Container(
 
 
 @callback(
-    Output("data", "data"),
+    Output("job", "data"),
     Output("spinner", "children"),
+    Output("job-poll", "disabled"),
     Input("submit_text", "n_clicks"),
-    Input("input_text", "value"),
+    State("input_text", "value"),  # Only submitted on click, not on each keystroke
 )
 def process_text(n, value):
     if n is not None:
         target_links = value.split("\n")
-        queries = get_from_wikipedia(target_links)
-        print("Done with processing text")
-        return queries, "Done with processing text"
+        return submit_job(target_links), "Processing text...", False
     else:
-        return None, None
+        return None, None, True
 
 
 @callback(
-    Output("data", "data", allow_duplicate=True),
+    Output("job", "data", allow_duplicate=True),
     Output("spinner", "children", allow_duplicate=True),
+    Output("job-poll", "disabled", allow_duplicate=True),
     Input("input_file", "contents"),
     State("input_file", "filename"),
     State("input_file", "last_modified"),
@@ -117,18 +115,17 @@ def process_file(content, name, date):
     if content is not None:
         content_type, content_string = content.split(",")
         target_links = base64.b64decode(content_string).decode().replace("\r", "").split("\n")
-        queries = get_from_wikipedia(target_links)
-        print("Done with processing file")
-        return queries, "Done with processing file"
+        return submit_job(target_links), "Processing file...", False
     else:
-        return None, None
+        return None, None, True
 
 
 @callback(
-    Output("data", "data", allow_duplicate=True),
+    Output("job", "data", allow_duplicate=True),
     Output("spinner", "children", allow_duplicate=True),
+    Output("job-poll", "disabled", allow_duplicate=True),
     Input("submit_gsheet", "n_clicks"),
-    Input("input_gsheet", "value"),
+    State("input_gsheet", "value"),
     prevent_initial_call="initial_duplicate",
 )
 def process_gsheet(n, value):
@@ -137,25 +134,63 @@ def process_gsheet(n, value):
 
         res = requests.get(url=csv_url)
         if res.status_code != 200:
-            return None, None
+            return None, None, True
         else:
             res.encoding = res.apparent_encoding  # So that we get properly encoded results
             target_links = [link[0] for link in csv.reader(res.text.strip().split("\n"))]
 
-        queries = get_from_wikipedia(target_links)
-        print("Done with processing gsheet")
-        return queries, "Done with processing gsheet"
+        return submit_job(target_links), "Processing gsheet...", False
+    else:
+        return None, None, True
+
+
+@callback(
+    Output("data", "data"),
+    Output("spinner", "children", allow_duplicate=True),
+    Output("job-poll", "disabled", allow_duplicate=True),
+    Input("job-poll", "n_intervals"),
+    State("job", "data"),
+    prevent_initial_call=True,
+)
+def poll_job(n, job_id):
+    if job_id is None:
+        return dash.no_update, None, True
+
+    status = job_status(job_id)
+    if status is None:
+        return dash.no_update, "Unknown job", True
+
+    if status["status"] == "done":
+        print(f"Done with job {job_id}")
+        return job_result(job_id), "Done with processing", True
+    elif status["status"] == "failed":
+        return dash.no_update, f"Processing failed: {status['error']}", True
+    elif status["total"]:
+        return dash.no_update, f"Processing: {status['done']}/{status['total']} articles done", False
     else:
-        return None, None
+        return dash.no_update, "Processing: looking for the articles...", False
 
 
 @callback(
-    Output("queries-text", "value"),
     Output("queries", "style"),
     Input("data", "data"),
 )
 def show_query(data):
     if data is not None:
-        return json.dumps(data, indent=2, ensure_ascii=False), {"display": "inline"}
+        return {"display": "inline"}
     else:
-        return None, {"display": "none"}
+        return {"display": "none"}
+
+
+@callback(
+    Output("download", "data"),
+    Input("queries-dl", "n_clicks"),
+    State("data", "data"),
+    prevent_initial_call=True,
+)
+def download_query(n_clicks, data):
+    # The whole result is only sent when asked for, it can be large
+    if data is None:
+        return dash.no_update
+
+    return dcc.send_string(json.dumps(load_result(data), indent=2, ensure_ascii=False), "queries.json")